@@ -1,6 +1,5 @@
 from .spiderman import *
 import re
-import json
 import numpy as np
 import pychord
 import operator
@@ -76,7 +75,7 @@ def searchSong(song, artist):
         site = website(f"https://www.ultimate-guitar.com/search.php?title={searchParam}&page={page}&type=300")
         
         try:
-            linkResults = json.loads(site.html(class_="js-store")[0]["data-content"])["store"]["page"]["data"]["results"]
+            linkResults = site.embeddedJson()["store"]["page"]["data"]["results"]
             linkResults = list(filter(lambda x: "id" in x, linkResults))
         except: break
             
@@ -86,16 +85,18 @@ def searchSong(song, artist):
     
     endResults = []
     
-    for index, link in enumerate(fullLinkResults):
+    links = [link.get("tab_url", "") for link in fullLinkResults]
+    
+    for link, subsite in zip(links, website.fetchMany(links, only="title")):
         
         try:
-        
-            link = link["tab_url"]
 
-            subsite = website(link)
+            if isinstance(subsite, Exception):
+                raise subsite
 
-            tabJson = json.loads(subsite.html(class_="js-store")[0]["data-content"])["store"]["page"]["data"]["tab_view"]["wiki_tab"]["content"]
-            statsJson = json.loads(subsite.html(class_="js-store")[0]["data-content"])["store"]["page"]["data"]["tab_view"]["stats"]
+            tabView = subsite.embeddedJson()["store"]["page"]["data"]["tab_view"]
+            tabJson = tabView["wiki_tab"]["content"]
+            statsJson = tabView["stats"]
             htmlTitle = subsite.html.find("title").string
             songName = htmlTitle.split("CHORDS")[0].strip().capitalize()
             artistName = htmlTitle.split(" by ", 1)[1].split("@")[0].strip()
@@ -230,7 +231,7 @@ def findBPM(song, artist):
     Find the BPM of the song based on its title and artist.
     """
     searchParam = "+".join(artist.split()) + "+" + "+".join(song.split())
-    site = website(f"https://tunebat.com/Search?q={searchParam}")
+    site = website(f"https://tunebat.com/Search?q={searchParam}", only = {"class_": "search-attribute-value"})
     
     try: 
         bpm = int(site.html(class_ = "search-attribute-value")[2].string)
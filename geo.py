@@ -1,4 +1,3 @@
-import requests
 import pandas as pd
 import geopandas as gpd
 import json
@@ -7,9 +6,18 @@ from .utils import *
 import itertools
 import shapely
 import contextily as ctx
-from tqdm import tqdm
 import matplotlib.pyplot as plt
-import fiona
+try:
+	import fiona
+except ImportError:
+	fiona = None
+import numpy as np
+import pickle
+import os
+import hashlib
+import html
+from concurrent.futures import ProcessPoolExecutor
+from scipy.spatial import cKDTree
 
 path_to_TrainStationExits = "../Geospatial/GEOSPATIAL/TrainStationExit_Jan2020/TrainStationExit06032020.shp"
 path_to_TrainStations = "../Geospatial/GEOSPATIAL/TrainStation_Jan2020/MRTLRTStnPtt.shp"
@@ -19,6 +27,219 @@ path_to_RoadNetwork = "../Geospatial/GEOSPATIAL/master-plan-2019-road-name-layer
 path_to_PlanningAreas = "../Geospatial/GEOSPATIAL/subzone-census-2010/Subzone_Census2010.kml"
 path_to_NationalMapLine = "../Geospatial/GEOSPATIAL/national-map-line/national-map-line-geojson.geojson"
 
+dataMallUrl = "http://datamall2.mytransport.sg/ltaodataservice/"
+
+"""
+PURPOSE
+
+The DataMall datasets that change from minute to minute, so they are never served from spiderman's cache.
+"""
+dataMallRealTime = ["BusArrivalv2", "CarParkAvailabilityv2", "TaxiAvailability", "TrafficIncidents",
+                    "TrafficSpeedBandsv2", "EstTravelTimes", "FaultyTrafficLights", "RoadOpenings", "RoadWorks",
+                    "VMS", "TrainServiceAlerts", "PCDRealTime"]
+
+def getDataMall(dataset, accountKey):
+	"""
+	PURPOSE
+
+	LTA's DataMall only gives out 500 records per request, so each dataset has to be paged through using the $skip parameter.
+	This goes through all the pages using the shared session from spiderman, so the connection to DataMall is kept alive throughout.
+	Throttled pages are retried by spiderman's rate limiter, and any page that still fails raises an error instead of quietly cutting the dataset short.
+	The real-time datasets (in dataMallRealTime) always skip spiderman's cache, so they are never out of date.
+
+	PARAMETERS
+
+	dataset [str]: name of the DataMall dataset, like "BusStops" or "BusRoutes"
+	accountKey [str]: your DataMall account key
+
+	OUTPUT
+
+	List of records (dicts)
+	"""
+	records = []
+	starting = 0
+	headers = {'AccountKey':accountKey}
+	while True:
+		response = fetch(dataMallUrl + dataset + '?$skip=' + str(starting), headers=headers, cache=dataset not in dataMallRealTime)
+		response.raise_for_status()
+		results = json.loads(response.text)['value']
+		if len(results) == 0:
+			break
+		records.extend(results)
+		starting += 500
+	return records
+
+
+_kmlCellRegex = re.compile(r"<(t[hd])\b[^>]*>\s*([^<]*?)\s*</t[hd]>|</tr>", flags=re.IGNORECASE)
+
+
+def decodeKML(descriptions, title = None, typed = True):
+	"""
+	PURPOSE
+
+	The attributes in the KML files from data.gov.sg are stuck inside an HTML table in each placemark's Description.
+	Getting each attribute out with its own str.extract() meant going through hundreds of megabytes of HTML once per attribute.
+	This goes through each Description just once, picking up every <th>/<td> (or <td>/<td>) pair in the table as a column.
+
+	PARAMETERS
+
+	descriptions [list, pandas Series]: the Description HTML of each placemark
+	title [str]: if given, the text of the first <td> (usually the placemark's title, like the subzone or road name) is also kept, under this column name
+	typed [boolean]: whether to turn the columns that are entirely numbers into numbers
+
+	OUTPUT
+
+	DataFrame with a column for each attribute (and the same index, if a Series was given)
+	"""
+	rows = []
+	for description in descriptions:
+		row = {}
+		cells = []
+		first = None
+		if isinstance(description, str):
+			for match in _kmlCellRegex.finditer(description):
+				if match.group(1) is None:
+					if len(cells) == 2:
+						row.setdefault(cells[0], cells[1])
+					cells = []
+					continue
+				text = html.unescape(match.group(2))
+				if first is None and match.group(1).lower() == "td":
+					first = text
+				cells.append(text)
+			if len(cells) == 2:
+				row.setdefault(cells[0], cells[1])
+		if title is not None:
+			row[title] = first
+		rows.append(row)
+
+	decoded = pd.DataFrame(rows, index=descriptions.index if isinstance(descriptions, pd.Series) else None)
+	if typed:
+		for column in decoded.columns:
+			if column == title:
+				continue
+			numbers = pd.to_numeric(decoded[column], errors="coerce")
+			if numbers.notna().sum() == decoded[column].notna().sum():
+				decoded[column] = numbers
+	return decoded
+
+
+def _decodeDescriptions(df, columns, title = None):
+	description = "Description" if "Description" in df.columns else "description"
+	decoded = decodeKML(df[description], title=title, typed=False)
+	df = df.drop(description, axis=1)
+	for column, key in columns.items():
+		df[column] = decoded[key] if key in decoded.columns else None
+	return df
+
+
+"""
+PURPOSE
+
+Where readCached() keeps its cached copies of the data files.
+If None, each one is kept right next to its source file.
+"""
+cacheFolder = None
+
+
+# the files that go along with a shapefile, and hold its attributes, projection and such
+_sidecarExtensions = [".shx", ".dbf", ".prj", ".cpg", ".sbn", ".sbx"]
+
+
+def _fileSignature(path, checksum = False):
+	stem, extension = os.path.splitext(path)
+	paths = [path]
+	if extension.lower() == ".shp":
+		for sidecar in _sidecarExtensions:
+			paths += [stem + ext for ext in [sidecar, sidecar.upper()] if os.path.exists(stem + ext)]
+
+	signature = {}
+	for file in paths:
+		stat = os.stat(file)
+		signature[os.path.basename(file)] = {"mtime": stat.st_mtime, "size": stat.st_size}
+		if checksum:
+			sha = hashlib.sha1()
+			with open(file, "rb") as f:
+				for block in iter(lambda: f.read(1 << 20), b""):
+					sha.update(block)
+			signature[os.path.basename(file)]["sha1"] = sha.hexdigest()
+	return signature
+
+
+def _functionSignature(function):
+	# the name alone isn't enough, as the cache should also be made again when the function itself is changed
+	code = function.__code__
+	consts = [x for x in code.co_consts if isinstance(x, (str, int, float, tuple, type(None)))]
+	return function.__module__ + "." + function.__qualname__ + ":" + hashlib.sha1(code.co_code + repr((code.co_names, consts)).encode()).hexdigest()
+
+
+def readCached(path, driver = None, columns = None, bbox = None, parse = None, format = "parquet", checksum = False, memoryMap = True):
+	"""
+	PURPOSE
+
+	Reading the KML, shapefile and GeoJSON files through fiona is slow (the road network KML especially), and it used to happen on every call.
+	This reads the file properly once, runs parse over it (to pull out the attribute columns and such), and saves the result as GeoParquet (or Feather).
+	After that, the cached copy is read instead, which only takes seconds.
+	The cache is made again whenever the source file changes (its modified time or size, or its contents if checksum = True), or when a different (or changed) parse function is used.
+	For shapefiles, the files that go with the .shp (.dbf, .prj etc.) are checked as well.
+
+	PARAMETERS
+
+	path [str]: the data file
+	driver [str]: the driver to read it with, like 'KML' (None to let geopandas guess)
+	columns [list]: only load these columns (plus the geometry)
+	bbox [tuple]: (minx, miny, maxx, maxy), to only keep the rows that fall in that box
+	parse [function]: takes the freshly read GeoDataFrame, and gives back the one to cache
+	format [str]: "parquet" or "feather"
+	checksum [boolean]: whether to also hash the file, for when the modified time can't be trusted
+	memoryMap [boolean]: whether to memory-map the cached file when reading it
+
+	OUTPUT
+
+	GeoDataFrame
+	"""
+	if format not in ["parquet", "feather"]:
+		raise Exception("'format' must be 'parquet' or 'feather'")
+
+	folder = cacheFolder if cacheFolder is not None else os.path.dirname(os.path.abspath(path))
+	cachePath = os.path.join(folder, os.path.basename(path) + "." + format)
+	signature = _fileSignature(path, checksum)
+	signature["parse"] = None if parse is None else _functionSignature(parse)
+
+	try:
+		with open(cachePath + ".json") as f:
+			fresh = json.load(f) == signature
+	except (OSError, ValueError):
+		fresh = False
+
+	if not fresh:
+		# fiona needs to be told that it can read KML (pyogrio, which newer geopandas uses, can already)
+		if driver == "KML" and fiona is not None:
+			fiona.drvsupport.supported_drivers['KML'] = 'rw'
+		df = gpd.read_file(path, driver=driver) if driver is not None else gpd.read_file(path)
+		if parse is not None:
+			df = parse(df)
+		os.makedirs(folder, exist_ok=True)
+		if format == "parquet":
+			df.to_parquet(cachePath)
+		else:
+			df.to_feather(cachePath)
+		with open(cachePath + ".json", "w") as f:
+			json.dump(signature, f)
+
+	if columns is not None:
+		columns = list(dict.fromkeys(list(columns) + ["geometry"]))
+	if format == "parquet":
+		df = gpd.read_parquet(cachePath, columns=columns, memory_map=memoryMap)
+	else:
+		df = gpd.read_feather(cachePath, columns=columns, memory_map=memoryMap)
+
+	if bbox is not None:
+		minx, miny, maxx, maxy = bbox
+		df = df.cx[minx:maxx, miny:maxy]
+	return df
+
+
 def getMRT():
 	"""
 	PURPOSE (NO LONGER WORKS FULLY)
@@ -78,8 +299,10 @@ def getMRT():
 	"""
 	mrt = []
 
-	for link in tqdm(stationLinks):
-		site = website(link)
+	for link, site in zip(stationLinks, website.fetchMany(stationLinks, progress=True)):
+		if isinstance(site, Exception):
+			print("page gave the error: " + str(site) + "\n" + link)
+			continue
 		try:
 			stationName = site.html("title")[0].string.split(" MRT")[0]
 		except Exception as e:
@@ -99,9 +322,10 @@ def getMRT():
 			stationLabels = None
 			stationChinese = None
 		
+		# the coordinates are only kept as text here, and are all parsed together with parseDMS() after the loop
 		try:
-			lat = convertCoords(*re.findall("[0-9.]+", site.html(class_="latitude")[0].text))
-			long = convertCoords(*re.findall("[0-9.]+", site.html(class_="longitude")[0].text))
+			lat = site.html(class_="latitude")[0].text
+			long = site.html(class_="longitude")[0].text
 		except Exception as e:
 			print("latlong gave the error: " + str(e) + "\n" + link)
 			lat = None
@@ -117,6 +341,10 @@ def getMRT():
 			postcode = None
 		mrt.append({"Label": stationLabels, "Name": stationName, "Chinese": stationChinese, "Address": address, "Postcode": postcode, "Lat": lat, "Long": long, "Link": link})
 
+	mrt = pd.DataFrame(mrt)
+	mrt["Lat"] = parseDMS(mrt.Lat)
+	mrt["Long"] = parseDMS(mrt.Long)
+
 
 	print("Mapping station names to their abbreviations.")
 	"""
@@ -137,8 +365,6 @@ def getMRT():
 
 	mrt["Abbreviation"] = mrt.Name.apply(tryAbb)
 
-	mrt = pd.DataFrame(mrt)
-
 
 	print("Finding coordinates of exits of MRT and LRT stations.")
 	"""
@@ -152,12 +378,12 @@ def getMRT():
 
 	I also did a mapping from the labels of the staitons (NS26, EW14) into their respective colors.
 	"""
-	exits = gpd.read_file(path_to_TrainStationExits)
+	exits = readCached(path_to_TrainStationExits)
 	exits["STN_NAME"] = exits["STN_NAME"].str.replace(" .RT STATION","").str.replace(" STATION","")
 	exits = exits[["STN_NAME","EXIT_CODE","geometry"]]
 	exits.columns = ["Name","Exit","geometry"]
 
-	stations = gpd.read_file(path_to_TrainStations)
+	stations = readCached(path_to_TrainStations)
 	stations["geometry"] = stations.geometry.to_crs(epsg=4326)
 	stations["STN_NAME"] = stations["STN_NAME"].str.replace(" .RT STATION","").str.replace(" STATION","")
 	stations = stations[["STN_NAME","STN_NO","geometry"]]
@@ -256,31 +482,8 @@ def getBus(accountKey):
 	# path_to_OriginDestinationBus = ""
 
 
-	busRoutes = []
-	starting = 0
-	while True:
-		try:
-			headers = {'AccountKey':accountKey}
-			results = requests.get('http://datamall2.mytransport.sg/ltaodataservice/BusRoutes?$skip=' + str(starting),headers=headers).text
-			results = json.loads(results)
-			if len(results['value']) == 0:
-				break
-			busRoutes.extend(results['value'])
-			starting += 500
-		except: break
-
-	busStops = []
-	starting = 0
-	while True:
-		try:
-			headers = {'AccountKey':accountKey}
-			results = requests.get('http://datamall2.mytransport.sg/ltaodataservice/BusStops?$skip=' + str(starting),headers=headers).text
-			results = json.loads(results)
-			if len(results['value']) == 0:
-				break
-			busStops.extend(results['value'])
-			starting += 500
-		except: break
+	busRoutes = getDataMall("BusRoutes", accountKey)
+	busStops = getDataMall("BusStops", accountKey)
 
 	bus = pd.DataFrame(busRoutes).merge(pd.DataFrame(busStops))
 
@@ -293,59 +496,120 @@ def getBus(accountKey):
 
 	return bus.merge(passengers)
 
-def getRoads():
+def _intersectChunk(geometries, shapes, offset):
+	left, right = shapely.STRtree(shapes).query(geometries, predicate = "intersects")
+	return left + offset, right
+
+
+def intersectPairs(geometries, shapes, processes = None, chunkSize = 5000):
+	"""
+	PURPOSE
+
+	Finds every pair of (geometry, shape) that intersect, like which subzones each road goes through.
+	Instead of checking every geometry against every shape, the shapes are put into an STRtree, and all the geometries are checked against it in one bulk query.
+	For really big inputs, the geometries can also be split into chunks that are done in separate processes.
+
+	PARAMETERS
+
+	geometries [list, numpy array, GeoSeries]: the geometries (like roads)
+	shapes [list, numpy array, GeoSeries]: the shapes (like subzones)
+	processes [int]: how many processes to use (None to just do it all in this one)
+	chunkSize [int]: how many geometries go into each chunk, when using processes
+
+	OUTPUT
+
+	(geometry indices, shape indices) numpy arrays, sorted by geometry and then by shape
+	"""
+	geometries, shapes = np.asarray(geometries, dtype = object), np.asarray(shapes, dtype = object)
+
+	if processes is None or len(geometries) <= chunkSize:
+		left, right = _intersectChunk(geometries, shapes, 0)
+	else:
+		starts = range(0, len(geometries), chunkSize)
+		with ProcessPoolExecutor(max_workers = processes) as pool:
+			chunks = list(pool.map(_intersectChunk, [geometries[start:start + chunkSize] for start in starts], itertools.repeat(shapes), starts))
+		left = np.concatenate([chunk[0] for chunk in chunks]) if chunks else np.array([], dtype = int)
+		right = np.concatenate([chunk[1] for chunk in chunks]) if chunks else np.array([], dtype = int)
+
+	order = np.lexsort((right, left))
+	return left[order], right[order]
+
+
+def _parseRoads(roads):
+	roads = _decodeDescriptions(roads, {"Name": "_title", "Type": "RD_TYP_CD"}, title="_title")
+	return roads[["Name", "Type", "geometry"]]
+
+
+def _parsePlanning(planning):
+	planning = _decodeDescriptions(planning, {"SubzoneCode": "Subzone Code",
+	                                          "Planning": "Planning Area Name",
+	                                          "PlanningCode": "Planning Area Code",
+	                                          "Region": "Region Name",
+	                                          "RegionCode": "Region Code"})
+	planning = planning.rename(columns={"Name":"Subzone"})
+	return planning[['Region', 'RegionCode', 'Planning', 'PlanningCode', 'Subzone', 'SubzoneCode', 'geometry']]
+
+
+def getRoads(processes = None, chunkSize = 5000, plot = True):
 	"""
 	PURPOSE
 
 	I made this code to extract combine road data with planning area data.
 	It is used to find roads within any particular planning area.
+	The roads are matched to the subzones they go through with intersectPairs(), instead of checking every road against every subzone.
 
 	Download data for road network: master-plan-2019-road-name-layer/road-network.kml
 	Download data for planning areas: subzone-census-2010/Subzone_Census2010.kml
+
+	PARAMETERS
+
+	processes [int]: how many processes to split the matching across (see intersectPairs())
+	chunkSize [int]: how many roads go to each process at a time
+	plot [boolean]: whether to plot the roads on a map of Singapore
+
+	OUTPUT
+
+	GeoDataFrame with a row for each road and subzone it goes through (roads that aren't in any subzone get blank subzone details)
 	"""
 	# path_to_RoadNetwork = ""
 	# path_to_PlanningAreas = ""
 
 
-	gpd.io.file.fiona.drvsupport.supported_drivers['KML'] = 'rw'
-	roads = gpd.read_file(path_to_RoadNetwork, driver='KML')
-	roads["Name"] = roads.Description.str.extract("<td>(.*?)</td>")
-	roads["Type"] = roads.Description.str.extract("RD_TYP_CD</th>.*?<td>(.*?)</td>")
-	roads = roads.drop("Description",axis=1)
+	roads = readCached(path_to_RoadNetwork, driver='KML', parse=_parseRoads)
+	planning = readCached(path_to_PlanningAreas, driver='KML', parse=_parsePlanning)
 
-	planning = gpd.read_file(path_to_PlanningAreas, driver='KML')
-	planning["SubzoneCode"] = planning.Description.str.extract("Subzone Code.*?<td>(.*?)</td>")
-	planning["Planning"] = planning.Description.str.extract("Planning Area Name.*?<td>(.*?)</td>")
-	planning["PlanningCode"] = planning.Description.str.extract("Planning Area Code.*?<td>(.*?)</td>")
-	planning["Region"] = planning.Description.str.extract("Region Name.*?<td>(.*?)</td>")
-	planning["RegionCode"] = planning.Description.str.extract("Region Code.*?<td>(.*?)</td>")
-	planning = planning.rename(columns={"Name":"Subzone"})
-	planning = planning.drop("Description",axis=1)
-	planning = planning[['Region', 'RegionCode', 'Planning', 'PlanningCode', 'Subzone', 'SubzoneCode', 'geometry']]
-
-	roadsm = roads.values.tolist()
-	planningm = planning.values.tolist()
-
-	roads = []
-	for road, line, rType in tqdm(roadsm):
-	    appeared = False
-	    for *details, shape in planningm:
-	        if line.within(shape) or line.intersects(shape):
-	            roads.append((road, rType, line) + tuple(details))
-	            appeared = True
-	    if not appeared:
-	        roads.append((road, rType, line) + ("",)*6)
-
-	roads = gpd.GeoDataFrame(roads)
+	roads = roads[["Name", "Type", "geometry"]].reset_index(drop=True)
+	details = ["Region", "RegionCode", "Planning", "PlanningCode", "Subzone", "SubzoneCode"]
+
+	# anything within a subzone also intersects it, so intersects alone covers both of the old checks
+	roadIndex, subzoneIndex = intersectPairs(roads.geometry.values, planning.geometry.values, processes=processes, chunkSize=chunkSize)
+
+	matched = pd.concat([roads.iloc[roadIndex].reset_index(drop=True),
+	                     pd.DataFrame(planning.iloc[subzoneIndex][details]).reset_index(drop=True)], axis=1)
+	matched["order"] = roadIndex
+	unmatched = roads[~np.isin(np.arange(len(roads)), roadIndex)].copy()
+	unmatched[details] = ""
+	unmatched["order"] = unmatched.index
+
+	roads = pd.concat([matched, unmatched]).sort_values("order", kind="stable").drop("order", axis=1).reset_index(drop=True)
 	roads.columns = ["Road", "Type", "geometry", "Region", "RegionCode", "Planning", "PlanningCode", "Subzone", "SubzoneCode"]
+	roads = gpd.GeoDataFrame(roads, geometry="geometry")
 
 	"""
 	PURPOSE
 
 	Visualisation of roads in Singapore.
 	"""
-	ax = roads[roads.Region != ""].plot(figsize=(15,15), column="Subzone")
-	ctx.add_basemap(ax=ax, zoom=13, crs="EPSG:4326")
+	if plot:
+		ax = roads[roads.Region != ""].plot(figsize=(15,15), column="Subzone")
+		ctx.add_basemap(ax=ax, zoom=13, crs="EPSG:4326")
+
+	return roads
+
+
+def _parseElevation(elevation):
+	elevation = _decodeDescriptions(elevation, {"Location": "_title"}, title="_title")
+	return elevation[["Location", "geometry"]]
 
 
 def generateElevationMap():
@@ -355,31 +619,49 @@ def generateElevationMap():
 	To estimate the altitude of a particular location, you need to preprocess the contour lines first.
 	That's what this code is for.
 	Be sure to save the output of this code as a variable, as it will be used for the actual altitude code.
+	Each contour line (all of its parts together) is closed up into a polygon, and the polygons are grouped into one MultiPolygon per altitude.
+	Everything is done on whole arrays of coordinates with shapely's vectorised functions, instead of one contour at a time.
 
 	Download national_map_line data: national-map-line/national-map-line-geojson.geojson
+
+	OUTPUT
+
+	GeoDataFrame with one row per altitude (alt, geometry), sorted by altitude
+	It can be saved with to_parquet() and read back with gpd.read_parquet().
 	"""
 
 	# path_to_NationalMapLine = ""
 
 
-	elevation = gpd.read_file(path_to_NationalMapLine)
-	elevation["Location"] = elevation.Description.str.extract("<td>(.*?)</td>")
+	elevation = readCached(path_to_NationalMapLine, parse=_parseElevation)
+	elevation = elevation[elevation.Location.astype(str).str.fullmatch(r"\d+") & elevation.geometry.notna()]
+
+	# the x and y of every point of every contour, and which contour each belongs to
+	coords, contour = shapely.get_coordinates(elevation.geometry.values, return_index=True)
+	alts = elevation.Location.astype(int).values
+
+	# a ring needs at least 4 coordinates once it is closed up, so the contours with fewer are left out
+	counts = np.bincount(contour, minlength=len(alts))
+	starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+	ends = starts + counts - 1
+	closed = np.zeros(len(alts), dtype=bool)
+	nonEmpty = counts > 0
+	closed[nonEmpty] = (coords[starts[nonEmpty]] == coords[ends[nonEmpty]]).all(axis=1)
+	keep = (counts + ~closed) >= 4
+	coords, contour = coords[keep[contour]], contour[keep[contour]]
+	contours = np.unique(contour)
+	polygons = shapely.polygons(shapely.linearrings(coords, indices=np.searchsorted(contours, contour)))
+	alts = alts[contours]
 
-	elevation = elevation[elevation.Location.str.contains(r"^\d+$")]
-	L = []
-	for geometry in elevation.geometry.tolist():
-	    try:
-	        L.append(shapely.geometry.Polygon([(float(i[0]), float(i[1])) for i in re.findall(r"(\d+\.\d+)\s(\d+\.\d+)", str(geometry))]))
-	    except:
-	        L.append("")
-	elevation["polygon"] = L
-	elevation = elevation[elevation.polygon != ""]
+	# contours that collapse into a line or a point (all their points in a row, or repeated) make polygons with no area, which break alt() and altMany()
+	hasArea = shapely.area(polygons) > 0
+	polygons, alts = polygons[hasArea], alts[hasArea]
 
-	multipolygons = []
-	for location in elevation.Location.unique():
-	    multipolygons.append({"alt": int(location), "geometry":shapely.geometry.MultiPolygon(elevation[elevation.Location == location].polygon.tolist())})
-	    
-	return gpd.GeoDataFrame(multipolygons)
+	order = np.argsort(alts, kind="stable")
+	uniqueAlts, group = np.unique(alts[order], return_inverse=True)
+	multipolygons = shapely.multipolygons(polygons[order], indices=group)
+
+	return gpd.GeoDataFrame({"alt": uniqueAlts, "geometry": multipolygons}, crs=elevation.crs)
 
 
 def alt(coords, elevationMap):
@@ -390,24 +672,221 @@ def alt(coords, elevationMap):
 	The way this code works is just finding the distance between the point and the two closest contour lines to it.
 	Then, by some formula (can see below), an estimation is made.
 
+	This goes through every contour for the one point, so for a lot of points, use altMany() instead (this is kept as the reference for it).
+	If there is no contour 20m above (like on top of a hill), the altitude of the highest contour around the point is given.
+
 	PARAMETERS
 
 	elevationMap: obtained when running the previous code, generateElevationMap()
-	coords [tuple of longitude and latitude]
+	coords [tuple of longitude and latitude, or a shapely Point]
 	"""
-	closestDistances = {x: 1000 for x in elevationMap.alt.unique()}
+	point = coords if isinstance(coords, shapely.geometry.base.BaseGeometry) else shapely.geometry.Point(coords)
+	parts = elevationMap.explode(index_parts=False)
+
+	closestDistances = {int(x): 1000 for x in parts.alt.unique()}
 	maxalt = 0
 
-	for polygon, alt in elevationMap[["polygon","Location"]].values.tolist():
-		point = coords
+	for polygon, alt in parts[["geometry","alt"]].values.tolist():
 		distance = polygon.exterior.distance(point)
 		closestDistances[int(alt)] = min(closestDistances[int(alt)], distance)
 		if point.within(polygon) and maxalt < int(alt):
 			maxalt = int(alt)
 
+	if maxalt not in closestDistances or maxalt + 20 not in closestDistances or closestDistances[maxalt] + closestDistances[maxalt + 20] == 0:
+		return maxalt
 	return ((maxalt + 20) * closestDistances[maxalt] + (maxalt) * closestDistances[maxalt + 20]) / (closestDistances[maxalt] + closestDistances[maxalt + 20])
 
 
+def _altModel(polygons, alts):
+	bands = {int(band): shapely.STRtree(shapely.get_exterior_ring(polygons[alts == band])) for band in np.unique(alts)}
+	return shapely.STRtree(polygons), alts, bands
+
+
+def _altPoints(coords, model):
+	tree, alts, bands = model
+	points = shapely.points(coords)
+
+	# the highest contour that each point is inside of
+	pointIndex, polygonIndex = tree.query(points, predicate="within")
+	maxalt = np.zeros(len(points), dtype=int)
+	np.maximum.at(maxalt, pointIndex, alts[polygonIndex])
+
+	# the distance to the nearest contour of the band at maxalt, and of the band 20m above
+	low = np.full(len(points), np.nan)
+	high = np.full(len(points), np.nan)
+	for band, rings in bands.items():
+		for distances, offset in [(low, 0), (high, 20)]:
+			which = np.flatnonzero(maxalt + offset == band)
+			if len(which) > 0:
+				(found, _), distance = rings.query_nearest(points[which], return_distance=True, all_matches=False)
+				distances[which[found]] = distance
+
+	result = maxalt.astype(float)
+	interpolate = ~np.isnan(low) & ~np.isnan(high) & (low + high > 0)
+	result[interpolate] = ((maxalt + 20) * low + maxalt * high)[interpolate] / (low + high)[interpolate]
+	return result
+
+
+_altWorkerModel = None
+
+def _altInit(polygons, alts):
+	global _altWorkerModel
+	_altWorkerModel = _altModel(polygons, alts)
+
+
+def _altChunk(coords):
+	return _altPoints(coords, _altWorkerModel)
+
+
+def altMany(points, elevationMap, processes = None, chunkSize = 5000):
+	"""
+	PURPOSE
+
+	alt() for a lot of points at once, like all the bus stops or MRT exits.
+	Instead of checking every contour for every point, the contours are put into STRtrees:
+		One for the contour polygons, to find the highest contour each point is in (one bulk "within" query)
+		One per altitude, for the contour lines themselves, to find the distance to the nearest one of that altitude
+	The same formula as alt() is then applied to all the points with numpy.
+	For really big inputs, the points can be split into chunks that are done in separate processes.
+
+	PARAMETERS
+
+	points [list of (longitude, latitude) tuples, numpy array, or GeoSeries/array of shapely Points]: the points
+	elevationMap: obtained from generateElevationMap()
+	processes [int]: how many processes to use (None to just do it all in this one)
+	chunkSize [int]: how many points go into each chunk, when using processes
+
+	OUTPUT
+
+	Numpy array of altitudes, in the same order as points
+	"""
+	if isinstance(points, gpd.GeoSeries) or (len(points) > 0 and isinstance(np.asarray(points, dtype=object).ravel()[0], shapely.geometry.base.BaseGeometry)):
+		coords = shapely.get_coordinates(np.asarray(points, dtype=object))
+	else:
+		coords = np.asarray(points, dtype=float).reshape(-1, 2)
+
+	polygons, part = shapely.get_parts(elevationMap.geometry.values, return_index=True)
+	alts = elevationMap.alt.astype(int).values[part]
+
+	if processes is None or len(coords) <= chunkSize:
+		return _altPoints(coords, _altModel(polygons, alts))
+
+	chunks = [coords[start:start + chunkSize] for start in range(0, len(coords), chunkSize)]
+	with ProcessPoolExecutor(max_workers=processes, initializer=_altInit, initargs=(polygons, alts)) as pool:
+		return np.concatenate(list(pool.map(_altChunk, chunks)))
+
+
+class ElevationRaster:
+	"""
+	PURPOSE
+
+	Even altMany() has to go through the contours for every point, which is too slow when millions of points need an altitude (like for routing).
+	This works out the altitude once for every point on a regular grid over Singapore (with altMany()), and saves the grid.
+	Looking up a point is then just a bilinear interpolation between the 4 grid points around it, done with numpy over whole arrays.
+	The grid is saved as a .npy file (memory-mapped when loaded back), along with its affine transform in a JSON file.
+	alt() stays as the reference for what the altitudes should be.
+
+	raster = ElevationRaster.build(elevationMap, resolution = 0.0005)
+	raster.save("elevation")
+	raster = ElevationRaster.load("elevation")
+	raster.lookup(lats, longs)
+
+	PARAMETERS
+
+	grid [2D numpy array]: the altitudes, with the first row being the northernmost
+	transform [list]: the affine transform (a, b, c, d, e, f) from (column, row) to (longitude, latitude), where long = a * column + b * row + c and lat = d * column + e * row + f
+	"""
+
+	def __init__(self, grid, transform):
+		self.grid = grid
+		self.transform = [float(x) for x in transform]
+		if self.transform[1] != 0 or self.transform[3] != 0:
+			raise Exception("rotated grids are not supported")
+
+
+	@classmethod
+	def build(cls, elevationMap, resolution = 0.0005, bounds = None, processes = None, chunkSize = 5000, dtype = np.float32):
+		"""
+		PURPOSE
+
+		Builds the grid from the contours in elevationMap.
+
+		PARAMETERS
+
+		elevationMap: obtained from generateElevationMap()
+		resolution [float]: the spacing of the grid in degrees (0.0005 is about 55m)
+		bounds [tuple]: (minx, miny, maxx, maxy) of the area to cover (defaults to all the contours)
+		processes, chunkSize: passed on to altMany()
+		dtype: what type to keep the altitudes as
+		"""
+		minx, miny, maxx, maxy = elevationMap.total_bounds if bounds is None else bounds
+		cols = int(np.ceil((maxx - minx) / resolution)) + 1
+		rows = int(np.ceil((maxy - miny) / resolution)) + 1
+
+		longs = minx + resolution * np.arange(cols)
+		lats = maxy - resolution * np.arange(rows)
+		grid = altMany(np.column_stack([np.tile(longs, rows), np.repeat(lats, cols)]), elevationMap, processes=processes, chunkSize=chunkSize)
+
+		return cls(grid.reshape(rows, cols).astype(dtype), [resolution, 0, minx, 0, -resolution, maxy])
+
+
+	def lookup(self, lats, longs):
+		"""
+		PURPOSE
+
+		The altitudes at the given coordinates, interpolated from the 4 grid points around each one.
+
+		PARAMETERS
+
+		lats, longs [float, list, numpy array, pandas Series]: the coordinates
+
+		OUTPUT
+
+		Numpy array of altitudes, with NaN for coordinates outside of the grid
+		"""
+		a, _, c, _, e, f = self.transform
+		rows, cols = self.grid.shape
+		x = (np.atleast_1d(np.asarray(longs, dtype=float)) - c) / a
+		y = (np.atleast_1d(np.asarray(lats, dtype=float)) - f) / e
+
+		inside = (x >= 0) & (x <= cols - 1) & (y >= 0) & (y <= rows - 1)
+		x, y = np.where(inside, x, 0), np.where(inside, y, 0)
+		col = np.clip(np.floor(x).astype(int), 0, max(cols - 2, 0))
+		row = np.clip(np.floor(y).astype(int), 0, max(rows - 2, 0))
+		dx, dy = x - col, y - row
+		right, below = np.minimum(col + 1, cols - 1), np.minimum(row + 1, rows - 1)
+
+		grid = self.grid
+		top = grid[row, col] * (1 - dx) + grid[row, right] * dx
+		bottom = grid[below, col] * (1 - dx) + grid[below, right] * dx
+		return np.where(inside, top * (1 - dy) + bottom * dy, np.nan)
+
+
+	def save(self, path):
+		"""
+		PURPOSE
+
+		Saves the grid and its transform into a folder.
+		"""
+		os.makedirs(path, exist_ok=True)
+		np.save(os.path.join(path, "grid.npy"), self.grid)
+		with open(os.path.join(path, "transform.json"), "w") as f:
+			json.dump({"transform": self.transform, "shape": list(self.grid.shape)}, f)
+
+
+	@classmethod
+	def load(cls, path, memoryMap = True):
+		"""
+		PURPOSE
+
+		Loads a grid saved by save().
+		By default the grid is memory-mapped, so only the parts that are looked up get read from disk.
+		"""
+		with open(os.path.join(path, "transform.json")) as f:
+			transform = json.load(f)["transform"]
+		return cls(np.load(os.path.join(path, "grid.npy"), mmap_mode="r" if memoryMap else None), transform)
+
+
 
 def getParkingLots(accountKey):
 	"""
@@ -415,19 +894,309 @@ def getParkingLots(accountKey):
 
 	Gets the number of Parking lots for particular locations.
 	"""
-	parking = []
-	starting = 0
-	while True:
-		try:
-			headers = {'AccountKey':accountKey}
-			results = requests.get('http://datamall2.mytransport.sg/ltaodataservice/CarParkAvailabilityv2?$skip=' + str(starting),headers=headers).text
-			results = json.loads(results)
-			if len(results['value']) == 0:
-				break
-			parking.extend(results['value'])
-			starting += 500
-		except: break
+	parking = getDataMall("CarParkAvailabilityv2", accountKey)
 
 	return pd.DataFrame(parking)
 
 
+
+def _unitVectors(lats, longs):
+	lats, longs = np.radians(np.asarray(lats, dtype = float)), np.radians(np.asarray(longs, dtype = float))
+	return np.column_stack([np.cos(lats) * np.cos(longs), np.cos(lats) * np.sin(longs), np.sin(lats)])
+
+
+class SpatialIndex:
+	"""
+	PURPOSE
+
+	Finding the nearest station or bus stop to somewhere used to mean going through every single one of them with dist().
+	This puts the points into a KD-tree, so that nearest-neighbour and radius queries only look at the points close by.
+	The points are stored as 3D unit vectors, so the straight-line (chord) distances in the tree convert exactly into the great-circle distances that dist() gives.
+	Building the tree takes a while for big frames, so it can be saved to disk with save() and loaded back with SpatialIndex.load().
+
+	index = SpatialIndex.fromFrame(mrtFull)
+	distances, indices = index.nearest([1.3521], [103.8198], k = 3)
+	index.rows(indices[0])
+
+	PARAMETERS
+
+	lats [list, numpy array, pandas Series]: latitudes of the points
+	longs [list, numpy array, pandas Series]: longitudes of the points
+	data [DataFrame]: the rows that go with the points, if any (like the stations themselves)
+	"""
+
+	def __init__(self, lats, longs, data = None):
+		self.lats = np.asarray(lats, dtype = float)
+		self.longs = np.asarray(longs, dtype = float)
+		if len(self.lats) != len(self.longs):
+			raise Exception("'lats' and 'longs' must be the same length")
+		if data is not None and len(data) != len(self.lats):
+			raise Exception("'data' must have one row per point")
+		self.data = data
+		self.tree = cKDTree(_unitVectors(self.lats, self.longs))
+
+
+	@classmethod
+	def fromFrame(cls, df, lat = "Lat", long = "Long"):
+		"""
+		PURPOSE
+
+		Builds the index from any frame with latitude and longitude columns (like mrtFull from getMRT(), or getBus() with lat = "Latitude", long = "Longitude").
+		Rows without coordinates are left out.
+		"""
+		df = df[df[lat].notna() & df[long].notna()].reset_index(drop = True)
+		return cls(df[lat].astype(float), df[long].astype(float), data = df)
+
+
+	def __len__(self):
+		return len(self.lats)
+
+
+	def nearest(self, lats, longs, k = 1, workers = 1):
+		"""
+		PURPOSE
+
+		Finds the k nearest points to each of the given coordinates.
+
+		PARAMETERS
+
+		lats, longs [float, list, numpy array, pandas Series]: the coordinates to search from
+		k [int]: how many of the nearest points to get
+		workers [int]: how many threads the tree can use (-1 for all of them)
+
+		OUTPUT
+
+		(distances in km, indices of the points), each of shape (n, k)
+		If there are fewer than k points, the missing ones have a distance of inf and an index of len(index).
+		"""
+		chords, indices = self.tree.query(_unitVectors(np.atleast_1d(lats), np.atleast_1d(longs)), k = [x + 1 for x in range(k)], workers = workers)
+		distances = 2 * earthRadius * np.arcsin(np.minimum(chords, 2) / 2)
+		return distances, indices
+
+
+	def within(self, lats, longs, radius, workers = 1):
+		"""
+		PURPOSE
+
+		Finds all the points within radius km of each of the given coordinates.
+
+		PARAMETERS
+
+		lats, longs [float, list, numpy array, pandas Series]: the coordinates to search from
+		radius [float]: the radius in km
+		workers [int]: how many threads the tree can use (-1 for all of them)
+
+		OUTPUT
+
+		List with a (sorted) numpy array of point indices for each coordinate
+		"""
+		chord = 2 * np.sin(min(radius / earthRadius, np.pi) / 2)
+		found = self.tree.query_ball_point(_unitVectors(np.atleast_1d(lats), np.atleast_1d(longs)), chord, workers = workers, return_sorted = True)
+		return [np.asarray(indices, dtype = int) for indices in found]
+
+
+	def rows(self, indices):
+		"""
+		PURPOSE
+
+		The rows of data that go with the given point indices.
+		"""
+		if self.data is None:
+			raise Exception("this index was built without any data")
+		return self.data.iloc[np.asarray(indices).ravel()]
+
+
+	def save(self, path):
+		"""
+		PURPOSE
+
+		Saves the index (tree included) to a file, so that it doesn't have to be built again next time.
+		"""
+		with open(path, "wb") as f:
+			pickle.dump(self, f, protocol = pickle.HIGHEST_PROTOCOL)
+
+
+	@staticmethod
+	def load(path):
+		"""
+		PURPOSE
+
+		Loads an index saved by save().
+		"""
+		with open(path, "rb") as f:
+			index = pickle.load(f)
+		if not isinstance(index, SpatialIndex):
+			raise Exception("%s does not contain a SpatialIndex" % path)
+		return index
+
+
+
+class PostcodeIndex:
+	"""
+	PURPOSE
+
+	postcodeCoords() used to search Google for every single postcode, which is slow, and gets blocked quickly.
+	This keeps Singapore's 6-digit postcodes in a sorted array, along with their coordinates, postal sector and nearest subzone.
+	Looking up a whole array of postcodes is then just one binary search (np.searchsorted), with no requests at all.
+	It is built once from the results that latlongMany() has already cached, and saved as .npy files that are memory-mapped when loaded back.
+
+	index = PostcodeIndex.fromStore("geocode.cache", subzones = planning)
+	index.save("postcodes")
+	index = PostcodeIndex.load("postcodes")
+	index.lookup(["410230", 238801])
+
+	PARAMETERS
+
+	postcodes [list, numpy array, pandas Series]: the postcodes
+	lats, longs [list, numpy array, pandas Series]: their coordinates
+	subzones [GeoDataFrame]: the subzones (like the planning areas in getRoads()), to find the nearest one to each postcode
+	name [str]: the column of subzones with the subzone names
+	"""
+
+	files = ["postcodes", "lats", "longs", "subzones"]
+
+	def __init__(self, postcodes = [], lats = [], longs = [], subzones = None, name = "Subzone"):
+		postcodes = PostcodeIndex.toInts(postcodes)
+		lats, longs = np.asarray(lats, dtype = float), np.asarray(longs, dtype = float)
+		keep = (postcodes >= 0) & ~np.isnan(lats) & ~np.isnan(longs)
+		postcodes, lats, longs = postcodes[keep], lats[keep], longs[keep]
+
+		# sort by postcode, keeping the first of any duplicates
+		postcodes, first = np.unique(postcodes, return_index = True)
+		self.postcodes = postcodes.astype(np.int32)
+		self.lats = lats[first]
+		self.longs = longs[first]
+
+		self.subzoneNames = []
+		self.subzones = np.full(len(self.postcodes), -1, dtype = np.int16)
+		if subzones is not None and len(self.postcodes) > 0:
+			self.subzoneNames = subzones[name].astype(str).tolist()
+			tree = shapely.STRtree(subzones.geometry.values)
+			nearest = tree.query_nearest(shapely.points(self.longs, self.lats), all_matches = False)
+			self.subzones[nearest[0]] = nearest[1]
+
+
+	@staticmethod
+	def toInts(postcodes):
+		"""
+		PURPOSE
+
+		Converts postcodes (strings like "410230" or "S410230", or ints) into ints, with -1 for anything that isn't a 6-digit postcode.
+		"""
+		ints = np.atleast_1d(np.asarray(postcodes))
+		if ints.dtype.kind in "iu":
+			ints = ints.astype(np.int64)
+			return np.where((ints >= 0) & (ints <= 999999), ints, -1)
+		postcodes = pd.Series(np.atleast_1d(np.asarray(postcodes, dtype = object)), dtype = object).astype(str)
+		postcodes = postcodes.str.extract(r"^\s*S?\s*(\d{1,6})(?:\.0)?\s*$", expand = False)
+		return pd.to_numeric(postcodes, errors = "coerce").fillna(-1).astype(np.int64).values
+
+
+	@classmethod
+	def fromStore(cls, store, subzones = None, name = "Subzone"):
+		"""
+		PURPOSE
+
+		Builds the index from the results cached by latlongMany(store = ...).
+		Every cached result that came with a postcode is used, whatever it was searched for.
+		"""
+		store = JobStore.of(store, "latlong")
+		postcodes, lats, longs = [], [], []
+		for key, result in store.results():
+			if result and result.get("postal"):
+				postcodes.append(result["postal"])
+				lats.append(result["lat"])
+				longs.append(result["long"])
+		return cls(postcodes, lats, longs, subzones = subzones, name = name)
+
+
+	def __len__(self):
+		return len(self.postcodes)
+
+
+	def find(self, postcodes):
+		"""
+		PURPOSE
+
+		Finds where each postcode is in the index.
+
+		OUTPUT
+
+		(positions, found): the positions in the index, and whether each postcode was actually there
+		"""
+		postcodes = PostcodeIndex.toInts(postcodes)
+		positions = np.searchsorted(self.postcodes, postcodes)
+		positions = np.minimum(positions, max(len(self.postcodes) - 1, 0))
+		found = (postcodes >= 0) & (len(self.postcodes) > 0)
+		if len(self.postcodes) > 0:
+			found &= self.postcodes[positions] == postcodes
+		return positions, found
+
+
+	def coords(self, postcodes):
+		"""
+		PURPOSE
+
+		The fastest lookup, for when only the coordinates are needed.
+
+		OUTPUT
+
+		(lats, longs) numpy arrays, with NaN for postcodes that aren't in the index
+		"""
+		positions, found = self.find(postcodes)
+		if len(self.postcodes) == 0:
+			return np.full(len(found), np.nan), np.full(len(found), np.nan)
+		return np.where(found, self.lats[positions], np.nan), np.where(found, self.longs[positions], np.nan)
+
+
+	def lookup(self, postcodes):
+		"""
+		PURPOSE
+
+		Looks up the coordinates, postal sector (the first 2 digits) and nearest subzone of each postcode.
+
+		OUTPUT
+
+		DataFrame with Postcode, Lat, Long, Sector and Subzone columns, in the same order as postcodes
+		Postcodes that aren't in the index have NaN coordinates and an empty Subzone.
+		"""
+		ints = PostcodeIndex.toInts(postcodes)
+		positions, found = self.find(ints)
+		lats, longs = self.coords(ints)
+		names = np.array(self.subzoneNames + [""], dtype = object)
+		subzones = self.subzones[positions] if len(self.postcodes) > 0 else np.full(len(found), -1)
+		subzones = np.where(found, subzones, -1)
+		return pd.DataFrame({"Postcode": np.where(ints >= 0, pd.Series(ints).astype(str).str.zfill(6), ""),
+		                     "Lat": lats,
+		                     "Long": longs,
+		                     "Sector": np.where(ints >= 0, ints // 10000, -1),
+		                     "Subzone": names[subzones]})
+
+
+	def save(self, path):
+		"""
+		PURPOSE
+
+		Saves the index into a folder of .npy files (plus the subzone names in a JSON file).
+		"""
+		os.makedirs(path, exist_ok = True)
+		for file in PostcodeIndex.files:
+			np.save(os.path.join(path, file + ".npy"), getattr(self, file))
+		with open(os.path.join(path, "subzoneNames.json"), "w") as f:
+			json.dump(self.subzoneNames, f)
+
+
+	@classmethod
+	def load(cls, path, memoryMap = True):
+		"""
+		PURPOSE
+
+		Loads an index saved by save().
+		By default the arrays are memory-mapped, so loading is instant and only the parts that are looked up get read from disk.
+		"""
+		index = cls.__new__(cls)
+		for file in PostcodeIndex.files:
+			setattr(index, file, np.load(os.path.join(path, file + ".npy"), mmap_mode = "r" if memoryMap else None))
+		with open(os.path.join(path, "subzoneNames.json")) as f:
+			index.subzoneNames = json.load(f)
+		return index
@@ -9,9 +9,7 @@ from translate import Translator
 import jaconv
 from hangul_romanize import Transliter
 from hangul_romanize.rule import academic
-import ast
 import random
-from tqdm import tqdm
 
 """
 PURPOSE
@@ -103,7 +101,7 @@ def chineseSentence(word, meanings = '', all_ = False):
     A list containing the sentence, its pinyin equivalent, and its English meaning.
     """
     try:
-        site = website('https://chinesepod.com/dictionary/english-chinese/' + word)
+        site = website('https://chinesepod.com/dictionary/english-chinese/' + word, only = 'table')
         site.getTables()
         meanings = re.findall('[A-Za-z]{3,15}',meanings)
         sentenceSets = site.tables[0][0].tolist()
@@ -173,16 +171,14 @@ def getHSKVocab(level):
     level [int, [1,6]]: input the HSK level of the vocabulary list you want
     """
     site = website('https://hsk.academy/en/hsk_%d' % level)
-    soup = site.html('script',string=re.compile('words'))[0]
-    words = re.findall('{"id".*?}',soup.string.replace('\\',''))
-    words = [ast.literal_eval(x) for x in words]
+    words = site.scriptJson('words', '{"id".*?}', unescape = True)
     df = pd.DataFrame(words)[['hanziRaw','trad','pinyinToneSpace','def']]
     df.columns = ['Word','Traditional','Word Pinyin','Usages']
     df['Level'] = 'HSK %d' % level
     return df
 
 
-def HSKSentence(word):
+def HSKSentence(word, site = None):
     """
     PURPOSE
 
@@ -192,9 +188,11 @@ def HSKSentence(word):
     PARAMETERS
 
     word [str]: word in the HSK list which you want to search
+    site [website object]: the word's page, if it has already been fetched (like from website.fetchMany())
     """
     try:
-        site = website('https://hsk.academy/en/words/%s' % word)
+        if site is None:
+            site = website('https://hsk.academy/en/words/%s' % word, only = 'li')
         results = []
         for span in site.html('span'):
             if span.parent.name == 'li':
@@ -205,18 +203,36 @@ def HSKSentence(word):
     except: return [['','']]
     
 
-def fullHSKProcess():
+def fullHSKProcess(store = None):
     """
     PURPOSE
 
     This conducts the whole process of getting the HSK words, as well as their sample sentences, using both functions mentioned above.
     It compiles the results into a singular dataframe, with standardised formats.
+
+    PARAMETERS
+
+    store [str or JobStore]: if given, each word's sentences is saved as soon as it is done, and the ones already saved are skipped when re-running after a crash
     """
+    store = JobStore.of(store, 'fullHSKProcess')
     hsk = pd.concat([getHSKVocab(level) for level in range(1,7)])
-    results = []
-    for word in tqdm(hsk['Word']):
-        results.append(HSKSentence(word))
-    hsk['results'] = results
+    words = list(dict.fromkeys(hsk['Word']))
+    todo = words if store is None else store.pending(words)
+
+    results = {}
+    sites = website.fetchIter(['https://hsk.academy/en/words/%s' % word for word in todo], progress = True, only = 'li')
+    for word, site in zip(todo, sites):
+        if isinstance(site, Exception):
+            print(word)
+            print(site)
+            continue
+        results[word] = HSKSentence(word, site)
+        if store is not None:
+            store.put(word, results[word])
+    if store is not None:
+        results = store.getMany(words)
+
+    hsk['results'] = hsk['Word'].apply(lambda x: results.get(x, [['','']]))
     hsk = hsk.explode('results')
     hsk['Sentence'] = hsk['results'].apply(lambda x: x[0])
     hsk['Sentence Pinyin'] = hsk['results'].apply(lambda x: x[1])
@@ -256,10 +272,11 @@ def japaneseSentence(word, meanings = '', all_ = False):
     A list containing the sentence, its romaji equivalent, and its English meaning.
     """
     try:
-        site = website('https://www.kanshudo.com/searcht?q=' + word)
+        site = website('https://www.kanshudo.com/searcht?q=' + word, only = {'class_': 'tatoeba'})
         meanings = re.findall('[A-Za-z]{3,15}',meanings)
         sentenceSets = site.html(class_='tatoeba')
-        sentenceSets = list(filter(lambda x:re.compile(regOR(meanings)).search(x.get_text()),sentenceSets))
+        matcher = keywordMatcher(meanings)
+        sentenceSets = list(filter(lambda x:matcher.search(x.get_text()),sentenceSets))
 
         if all_:
             toReturn = []
@@ -352,13 +369,110 @@ def tryFindKanji(x, exact = False):
     except: return {}
 
 
-def JLPTKanji():
+def _kanjiReadings(string):
+    readings = []
+    for word in list(string.next_siblings):
+        try:
+            readings.append(tuple(map(lambda x: x.strip(), re.split("【|】",word))))
+        except: continue
+    return readings
+
+
+def _kanjiSentence(h):
+    jap, *a, romaji, meaning = list(map(allstr, h.next_siblings))
+    return (jap, romaji, meaning)
+
+
+"""
+PURPOSE
+
+Where everything on a JLPTsensei kanji page is, so that the page only needs to be gone through once.
+"""
+kanjiSpec = Spec({"kpro": {"class_": "header-kunyomi", "get": lambda x: allstr(x, " "), "default": ""},
+                  "opro": {"class_": "header-onyomi", "get": lambda x: allstr(x, " "), "default": ""},
+                  "krea": {"string": "Kunyomi Readings", "get": _kanjiReadings, "default": []},
+                  "orea": {"string": "Onyomi Readings", "get": _kanjiReadings, "default": []},
+                  "sentences": {"tag": "h5", "all": True, "get": _kanjiSentence},
+                  "rank": {"string": "^2,500$", "previous": "b", "n": 2, "get": lambda x: int(allstr(x)), "default": 0},
+                  "meaning": {"string": "Meaning: ", "get": str, "default": ""},
+                  "kanji": {"string": "Meaning of", "get": lambda x: x.replace("Meaning of","").strip(), "default": ""}})
+
+
+def JLPTKanjiPage(link, subsite = None):
+    """
+    PURPOSE
+
+    Extracts the readings, sample sentences and meaning of a single kanji from its JLPTsensei page.
+    This is used by JLPTKanji() for every kanji in the list.
+
+    PARAMETERS
+
+    link [str]: link to the kanji's page
+    subsite [website object]: the kanji's page, if it has already been fetched (like from website.fetchMany())
+    """
+    if subsite is None:
+        subsite = website(link)
+
+    result = []
+
+    fields = kanjiSpec.extract(subsite)
+    kpro, opro, krea, orea = fields["kpro"], fields["opro"], fields["krea"], fields["orea"]
+    sentences, rank, meaning, kanji = fields["sentences"], fields["rank"], fields["meaning"], fields["kanji"]
+
+    for sentence in sentences:
+        try:
+            result.append({"Rank":rank,
+                           "Kanji":kanji,
+                           "Word":kanji,
+                           "KPro":kpro,
+                           "OPro":opro,
+                           "Meaning":meaning,
+                           "Sentence":sentence[0],
+                           "Romaji":sentence[1],
+                           "SMeaning":sentence[2]})
+        except: None
+
+    for kre in krea:
+        try:
+            result.append({"Rank":rank,
+                           "Kanji":kanji,
+                           "Word":kre[0],
+                           "KPro":kre[1],
+                           "OPro":"",
+                           "Meaning":kre[2],
+                           "Sentence":"",
+                           "Romaji":"",
+                           "SMeaning":""})
+        except: None
+
+    for ore in orea:
+        try:
+            result.append({"Rank":rank,
+                           "Kanji":kanji,
+                           "Word":ore[0],
+                           "KPro":ore[1],
+                           "OPro":"",
+                           "Meaning":ore[2],
+                           "Sentence":"",
+                           "Romaji":"",
+                           "SMeaning":""})
+        except: None
+    return result
+
+
+def JLPTKanji(store = None, processes = False):
     """
     PURPOSE
 
     JLPTsensei has a very good list of Kanji, ordered by frequency of use.
     This function basically just extracts useful information yet again, and I had to apply alot of standardisation principles in all of this.
+
+    PARAMETERS
+
+    store [str or JobStore]: if given, each kanji's page is saved as soon as it is done, and the ones already saved are skipped when re-running after a crash
+    processes [boolean]: whether to parse the pages in a pool of processes (refer to pipeline()), to use all the cores
     """
+    store = JobStore.of(store, 'JLPTKanji')
     links = []
     i = 1
     while i < 12:
@@ -369,90 +483,27 @@ def JLPTKanji():
         except:
             break
     links = list(set(links))
+    todo = links if store is None else store.pending(links)
 
-    result = []
-
-    for link in tqdm(links):
-
-        subsite = website(link)
-
-        try: kpro = allstr(subsite.html(class_="header-kunyomi")[0]," ")
-        except: kpro = ""
-        try: opro = allstr(subsite.html(class_="header-onyomi")[0]," ")
-        except: opro = ""
-
-        krea = []
-        try:
-            for word in list(subsite.html(text=re.compile("Kunyomi Readings"))[0].next_siblings):
-                try:
-                    krea.append(tuple(map(lambda x: x.strip(), re.split("【|】",word))))
-                except: continue
-        except: None            
-
-        orea = []
-        try:
-            for word in list(subsite.html(text=re.compile("Onyomi Readings"))[0].next_siblings):
-                try:
-                    orea.append(tuple(map(lambda x: x.strip(), re.split("【|】",word))))
-                except: continue
-        except: None
-
-        sentences = []
-        for h in subsite.html("h5"):
-            try:
-                jap, *a, romaji, meaning = list(map(allstr, h.next_siblings))
-                sentences.append((jap, romaji, meaning))
-            except: continue
-
-        try: rank = int(allstr(subsite.html(text="2,500")[0].find_previous("b").find_previous("b")))
-        except: rank = 0
-        try: meaning = subsite.html(text=re.compile("Meaning: "))[0]
-        except: meaning = ""
-        try: kanji = subsite.html(text=re.compile("Meaning of"))[0].replace("Meaning of","").strip()
-        except: kanji = ""
+    pages = {}
+    for link, page in pipeline(todo, JLPTKanjiPage, processes = processes, progress = True):
+        if isinstance(page, Exception):
+            print(link)
+            print(page)
+            continue
+        pages[link] = page
+        if store is not None:
+            store.put(link, pages[link])
+    if store is not None:
+        pages = store.getMany(links)
 
-        for sentence in sentences:
-            try:
-                result.append({"Rank":rank,
-                               "Kanji":kanji,
-                               "Word":kanji,
-                               "KPro":kpro,
-                               "OPro":opro,
-                               "Meaning":meaning,
-                               "Sentence":sentence[0],
-                               "Romaji":sentence[1],
-                               "SMeaning":sentence[2]})
-            except: None
-
-        for kre in krea:
-            try:
-                result.append({"Rank":rank,
-                               "Kanji":kanji,
-                               "Word":kre[0],
-                               "KPro":kre[1],
-                               "OPro":"",
-                               "Meaning":kre[2],
-                               "Sentence":"",
-                               "Romaji":"",
-                               "SMeaning":""})
-            except: None
-
-        for ore in orea:
-            try:
-                result.append({"Rank":rank,
-                               "Kanji":kanji,
-                               "Word":ore[0],
-                               "KPro":ore[1],
-                               "OPro":"",
-                               "Meaning":ore[2],
-                               "Sentence":"",
-                               "Romaji":"",
-                               "SMeaning":""})
-            except: None
+    result = []
+    for link in links:
+        result.extend(pages.get(link, []))
     return result
 
 
-def japaneseLesson(link):
+def japaneseLesson(link, si = None):
     """
     PURPOSE
 
@@ -460,8 +511,14 @@ def japaneseLesson(link):
     Based on a particular link from kanshudo, this function extracts alot of useful information and standardises them into sizeable lesson points.
     On its own, it's quite useless.
     So just use the japaneseLessonFull() function to get all the lessons at once, then decide from there what you want.
+
+    PARAMETERS
+
+    link [str]: link to the lesson
+    si [website object]: the lesson's page, if it has already been fetched (like from website.fetchMany())
     """
-    si = website(link)
+    if si is None:
+        si = website(link)
     results = []
     for h4 in si.html('h4'):
         word = h4.get_text().split(' - Grammar')[0]
@@ -557,14 +614,21 @@ def japaneseLesson(link):
         
     return results
 
-def japaneseLessonFull():
+def japaneseLessonFull(store = None, processes = False):
     """
     PURPOSE
 
     This function extracts all the lesson points from the 5 levels of the JLPT syllabus from Kanshudo.
     It gets pretty much the grammar points, their explanations, sample sentences etc.
+
+    PARAMETERS
+
+    store [str or JobStore]: if given, each lesson is saved as soon as it is done, and the ones already saved are skipped when re-running after a crash
+    processes [boolean]: whether to parse the pages in a pool of processes (refer to pipeline()), to use all the cores
     """
+    store = JobStore.of(store, 'japaneseLessonFull')
     masterResults = []
+    seen = set()
 
     for i in range(1,6):
         pageNum = 1
@@ -578,9 +642,26 @@ def japaneseLessonFull():
                 if len(hrefs) == 0:
                     break
 
-                for href in tqdm(hrefs):
-                    try: masterResults.extend(japaneseLesson('https://www.kanshudo.com' + href['href']))
-                    except: continue
+                links = []
+                for href in hrefs:
+                    link = 'https://www.kanshudo.com' + href['href']
+                    if Crawler.key(link) not in seen:
+                        seen.add(Crawler.key(link))
+                        links.append(link)
+                todo = links if store is None else store.pending(links)
+
+                lessons = {}
+                for link, lesson in pipeline(todo, japaneseLesson, processes = processes, progress = True):
+                    if isinstance(lesson, Exception):
+                        continue
+                    lessons[link] = lesson
+                    if store is not None:
+                        store.put(link, lessons[link])
+                if store is not None:
+                    lessons = store.getMany(links)
+
+                for link in links:
+                    masterResults.extend(lessons.get(link, []))
 
             except Exception as e:
                 print(e)
@@ -622,7 +703,7 @@ def tryHanja(x,tolerance=2):
     except: return ''
 
 
-def koreanLesson(link):
+def koreanLesson(link, site = None):
     """
     PURPOSE
 
@@ -631,8 +712,14 @@ def koreanLesson(link):
     This was much easier said than done, because there was alot of unstructured content in the site.
     There was alot of pattern-finding and regex searches to be done.
     Similar to japaneseLesson(), this function is useless on its own, just necessary for the koreanLessonFull function.
+
+    PARAMETERS
+
+    link [str]: link to the lesson
+    site [website object]: the lesson's page, if it has already been fetched (like from website.fetchMany())
     """
-    site = website(link)
+    if site is None:
+        site = website(link)
     title = re.findall(r'Lesson \d+',site.html(class_='titlebar-title')[0].get_text())[0]
     words = {}
     for collapse in site.html(class_='collapseomatic'):
@@ -695,26 +782,45 @@ def koreanLesson(link):
     return {title:{'Link':link,'Words':words,'Contents':contents}}
 
 
-def koreanLessonFull():
+def koreanLessonFull(store = None, processes = False):
     """
     PURPOSE
 
     This function extracts all the lesson info from the howtostudykorean.com lesson plan.
     It gives the links to the lessons, the new vocabulary contained within them, as well as the contents for the lessons themselves.
+
+    PARAMETERS
+
+    store [str or JobStore]: if given, each lesson is saved as soon as it is done, and the ones already saved are skipped when re-running after a crash
+    processes [boolean]: whether to parse the pages in a pool of processes (refer to pipeline()), to use all the cores
     """
+    store = JobStore.of(store, 'koreanLessonFull')
     site = website('https://www.howtostudykorean.com/other-stuff/lesson-list/')
     links = []
+    seen = set()
     for i in site.html(string=re.compile('Lesson ')):
         try: 
             link = i.find_previous('a')['href']
-            if 'other-stuff' not in link:
+            if 'other-stuff' not in link and Crawler.key(link) not in seen:
+                seen.add(Crawler.key(link))
                 links.append(link)
         except: continue
 
-    lessons = {}
-    for link in tqdm(links):
-        try:lessons.update(getLesson(link))
-        except Exception as e:
+    todo = links if store is None else store.pending(links)
+
+    done = {}
+    for link, lesson in pipeline(todo, koreanLesson, processes = processes, progress = True):
+        if isinstance(lesson, Exception):
             print(link)
-            print(e)
+            print(lesson)
+            continue
+        done[link] = lesson
+        if store is not None:
+            store.put(link, done[link])
+    if store is not None:
+        done = store.getMany(links)
+
+    lessons = {}
+    for link in links:
+        lessons.update(done.get(link, {}))
     return lessons
\ No newline at end of file
@@ -1,10 +1,854 @@
 import requests
 from bs4 import BeautifulSoup as bs
+from bs4 import SoupStrainer
+from bs4.element import NavigableString, PreformattedString
+import soupsieve
 from tld import get_tld
 import pandas as pd
 import re
+import ast
 import copy
-from urllib.parse import urljoin
+import html
+import json
+import sqlite3
+import threading
+import time
+import queue
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from urllib.parse import urljoin, urlparse
+from tqdm import tqdm
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+from urllib.robotparser import RobotFileParser
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from collections import deque
+import hashlib
+import math
+import sys
+import urllib3
+import zipfile
+from email.utils import parsedate_to_datetime
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+"""
+PURPOSE
+
+Every page in this package used to be fetched with a bare requests.get(), which opens a brand new TCP and TLS connection each time.
+For big scrapes off the same few hosts, those handshakes took up most of the time.
+So instead, all requests now go through one shared session, which keeps connections alive in a pool per host and retries failed requests with backoff.
+These are the settings for that session, and they can be changed using configureSession().
+
+timeout [float or tuple of (connect, read)]: seconds to wait before giving up on a request
+retries [int]: the number of times a failed request is retried
+backoff [float]: the backoff factor between retries (0.5 waits 0.5s, 1s, 2s...)
+statusForcelist [list of int]: the status codes which are retried
+                               429 and 503 are left out, because those mean that we are being throttled, and the RateLimiter handles them instead.
+                               The session also ignores Retry-After headers (urllib3 would otherwise retry 429s and 503s by itself), so that they reach the RateLimiter.
+poolConnections [int]: the number of hosts to keep connection pools for
+poolSize [int]: the number of connections kept alive per host
+"""
+sessionSettings = {"timeout": (10, 30),
+                   "retries": 3,
+                   "backoff": 0.5,
+                   "statusForcelist": [500, 502, 504],
+                   "poolConnections": 16,
+                   "poolSize": 32}
+
+_session = None
+_sessionLock = threading.Lock()
+_cache = None
+_cassette = None
+_profiler = None
+_createConnection = urllib3.util.connection.create_connection
+
+
+def _buildSession():
+    retry = Retry(total = sessionSettings["retries"],
+                  backoff_factor = sessionSettings["backoff"],
+                  status_forcelist = sessionSettings["statusForcelist"],
+                  allowed_methods = frozenset(["GET", "HEAD"]),
+                  raise_on_status = False,
+                  respect_retry_after_header = False)
+    adapter = HTTPAdapter(pool_connections = sessionSettings["poolConnections"],
+                          pool_maxsize = sessionSettings["poolSize"],
+                          max_retries = retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def getSession():
+
+    """
+    PURPOSE
+
+    Returns the process-wide requests.Session, creating it on first use.
+    There's usually no need to call this directly, since fetch() does it for you.
+
+    OUTPUT
+
+    requests.Session object
+    """
+
+    global _session
+    if _session is None:
+        with _sessionLock:
+            if _session is None:
+                _session = _buildSession()
+    return _session
+
+
+def configureSession(**settings):
+
+    """
+    PURPOSE
+
+    Changes the settings of the shared session (refer to sessionSettings above).
+    The old session is closed, and a new one is built with the new settings on the next request.
+
+    PARAMETERS
+
+    settings: any of the keys in sessionSettings, like configureSession(timeout = 60, retries = 5)
+    """
+
+    global _session
+    for key in settings:
+        if key not in sessionSettings:
+            raise Exception("'%s' is not a session setting" % key)
+
+    with _sessionLock:
+        sessionSettings.update(settings)
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+class ResponseCache:
+
+    """
+    PURPOSE
+
+    Re-running a big scrape after fixing one parser bug used to mean downloading every page all over again.
+    This class stores the bodies of fetched pages on disk (in a SQLite file), keyed by url, so that later runs can be served from disk instead.
+    Each entry is fresh for a set number of seconds (which can be different for each domain).
+    Once it goes stale, the page is revalidated using its ETag/Last-Modified headers, so unchanged pages don't need to be downloaded again.
+    When the cache grows past its size cap, the least recently used pages are thrown out first.
+    Normally, this is set up through enableCache() rather than on its own.
+
+    PARAMETERS
+
+    path [str]: where the cache file is kept
+    ttl [float]: the default number of seconds an entry stays fresh for
+    domainTtls [dict]: ttls for particular domains, like {"wikipedia.org": 7 * 86400, "mytransport.sg": 0}
+                       A domain also covers all its subdomains.
+    maxBytes [int]: the maximum total size of the stored bodies
+    """
+
+    def __init__(self, path = "spiderman.cache", ttl = 86400, domainTtls = {}, maxBytes = 2 ** 30):
+
+        self.path = path
+        self.ttl = ttl
+        self.domainTtls = domainTtls
+        self.maxBytes = maxBytes
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread = False)
+        self.db.execute("CREATE TABLE IF NOT EXISTS responses (url TEXT PRIMARY KEY, status INTEGER, headers TEXT, encoding TEXT, body BLOB, size INTEGER, fetched REAL, accessed REAL)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS responsesAccessed ON responses (accessed)")
+        self.db.commit()
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+
+    def ttlFor(self, url):
+
+        """
+        PURPOSE
+
+        Finds the ttl of a url, going from the most specific domain (en.wikipedia.org) to the least specific (org).
+        """
+
+        host = urlparse(url).netloc.split(":")[0]
+        parts = host.split(".")
+        for i in range(len(parts)):
+            domain = ".".join(parts[i:])
+            if domain in self.domainTtls:
+                return self.domainTtls[domain]
+        return self.ttl
+
+
+    def get(self, url):
+
+        """
+        PURPOSE
+
+        Looks up a url in the cache.
+
+        OUTPUT
+
+        None if the url isn't cached.
+        Otherwise, a dict of the stored entry, along with whether it is still "fresh".
+        """
+
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT status, headers, encoding, body, fetched FROM responses WHERE url = ?", (url,)).fetchone()
+            if row is None:
+                return None
+            self.db.execute("UPDATE responses SET accessed = ? WHERE url = ?", (now, url))
+            self.db.commit()
+
+        status, headers, encoding, body, fetched = row
+        return {"url": url,
+                "status": status,
+                "headers": json.loads(headers),
+                "encoding": encoding,
+                "body": body,
+                "fresh": now - fetched < self.ttlFor(url)}
+
+
+    def put(self, url, response):
+
+        """
+        PURPOSE
+
+        Stores a requests.Response in the cache, then throws out old entries if the cache has gone over its size cap.
+        """
+
+        now = time.time()
+        body = response.content
+        headers = {key: response.headers[key] for key in ["Content-Type", "ETag", "Last-Modified"] if key in response.headers}
+        with self.lock:
+            old = self.db.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+            if old is not None:
+                self.size -= old[0]
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                            (url, response.status_code, json.dumps(headers), response.encoding, body, len(body), now, now))
+            self.size += len(body)
+            self._evict()
+            self.db.commit()
+
+
+    def touch(self, url):
+
+        """
+        PURPOSE
+
+        Marks an entry as fresh again, for when the server says that the page has not been modified (304).
+        """
+
+        now = time.time()
+        with self.lock:
+            self.db.execute("UPDATE responses SET fetched = ?, accessed = ? WHERE url = ?", (now, now, url))
+            self.db.commit()
+
+
+    def _evict(self):
+        while self.size > self.maxBytes:
+            rows = self.db.execute("SELECT url, size FROM responses ORDER BY accessed LIMIT 100").fetchall()
+            if len(rows) == 0:
+                break
+            for url, size in rows:
+                self.db.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self.size -= size
+                if self.size <= self.maxBytes:
+                    break
+
+
+    def clear(self):
+
+        """
+        PURPOSE
+
+        Empties the whole cache.
+        """
+
+        with self.lock:
+            self.db.execute("DELETE FROM responses")
+            self.db.commit()
+            self.size = 0
+
+
+    @staticmethod
+    def response(entry):
+
+        """
+        PURPOSE
+
+        Rebuilds a requests.Response from a cached entry, so that callers can't tell the difference.
+        """
+
+        response = requests.Response()
+        response.url = entry["url"]
+        response.status_code = entry["status"]
+        response.headers = CaseInsensitiveDict(entry["headers"])
+        response.encoding = entry["encoding"]
+        response._content = entry["body"]
+        return response
+
+
+def enableCache(path = "spiderman.cache", **settings):
+
+    """
+    PURPOSE
+
+    Turns on the on-disk response cache for every request made through fetch() (and hence website()).
+    Refer to ResponseCache for the settings.
+
+    OUTPUT
+
+    The ResponseCache object, in case you want to clear it or look into it.
+    """
+
+    global _cache
+    _cache = ResponseCache(path, **settings)
+    return _cache
+
+
+def disableCache():
+
+    """
+    PURPOSE
+
+    Turns off the response cache. The cache file itself is left alone.
+    """
+
+    global _cache
+    _cache = None
+
+
+class RateLimiter:
+
+    """
+    PURPOSE
+
+    Once pages are fetched concurrently, sites like ultimate-guitar, jisho and DataMall start throttling us.
+    This keeps a token bucket for each host, so that requests to a host are spaced out to a set rate.
+    Whenever a host answers with 429 (Too Many Requests) or 503, its rate is halved and its requests are paused for as long as its Retry-After header asks.
+    Each successful request then nudges the rate back up, so over time it settles at the highest rate the host puts up with.
+    Normally, this is set up through enableRateLimit() rather than on its own.
+
+    PARAMETERS
+
+    rate [float]: the starting number of requests per second for each host
+    burst [float]: the number of requests that can be sent at once before the rate kicks in
+    maxRate [float]: the highest rate that a host can be nudged up to (defaults to rate)
+    minRate [float]: the lowest rate that a host can be cut down to
+    increase [float]: how much the rate goes up by after each successful request
+    domainRates [dict]: starting (and highest) rates for particular hosts, like {"datamall2.mytransport.sg": 2}
+    """
+
+    def __init__(self, rate = 10, burst = 10, maxRate = None, minRate = 0.1, increase = 0.05, domainRates = {}):
+
+        self.rate = rate
+        self.burst = burst
+        self.maxRate = max(maxRate or rate, rate)
+        self.minRate = minRate
+        self.increase = increase
+        self.domainRates = domainRates
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+
+    def _bucket(self, host):
+        if host not in self.buckets:
+            if host in self.domainRates:
+                rate = maxRate = self.domainRates[host]
+            else:
+                rate, maxRate = self.rate, self.maxRate
+            self.buckets[host] = {"rate": rate, "maxRate": maxRate, "tokens": self.burst, "updated": time.time(),
+                                  "blockedUntil": 0, "requests": 0, "throttled": 0, "waited": 0.0}
+        return self.buckets[host]
+
+
+    def acquire(self, host):
+
+        """
+        PURPOSE
+
+        Waits until a request to the host is allowed, then uses up one token.
+        """
+
+        while True:
+            with self.lock:
+                bucket = self._bucket(host)
+                now = time.time()
+                bucket["tokens"] = min(self.burst, bucket["tokens"] + (now - bucket["updated"]) * bucket["rate"])
+                bucket["updated"] = now
+                if bucket["blockedUntil"] > now:
+                    wait = bucket["blockedUntil"] - now
+                elif bucket["tokens"] >= 1:
+                    bucket["tokens"] -= 1
+                    bucket["requests"] += 1
+                    return
+                else:
+                    wait = (1 - bucket["tokens"]) / bucket["rate"]
+                bucket["waited"] += wait
+            time.sleep(wait)
+
+
+    def throttled(self, host, retryAfter = None):
+
+        """
+        PURPOSE
+
+        Backs off after the host throttles us, halving its rate and pausing it for retryAfter seconds (or one request's worth of time).
+        """
+
+        with self.lock:
+            bucket = self._bucket(host)
+            bucket["rate"] = max(self.minRate, bucket["rate"] / 2)
+            bucket["tokens"] = 0
+            bucket["throttled"] += 1
+            bucket["blockedUntil"] = max(bucket["blockedUntil"], time.time() + (retryAfter if retryAfter is not None else 1 / bucket["rate"]))
+
+
+    def succeeded(self, host):
+
+        """
+        PURPOSE
+
+        Nudges the host's rate back up after a successful request.
+        """
+
+        with self.lock:
+            bucket = self._bucket(host)
+            bucket["rate"] = min(bucket["maxRate"], bucket["rate"] + self.increase)
+
+
+    def report(self):
+
+        """
+        PURPOSE
+
+        Shows how each host has been treated so far.
+
+        OUTPUT
+
+        Dataframe with the number of requests, the number of times we were throttled, the total seconds spent waiting and the current rate for each host.
+        """
+
+        with self.lock:
+            return pd.DataFrame([{"Host": host, "Requests": bucket["requests"], "Throttled": bucket["throttled"],
+                                  "Waited": bucket["waited"], "Rate": bucket["rate"]} for host, bucket in self.buckets.items()])
+
+
+def enableRateLimit(**settings):
+
+    """
+    PURPOSE
+
+    Turns on rate limiting for every request made through fetch() (and hence website()).
+    Rate limiting is already on by default, so this is mainly for changing its settings (refer to RateLimiter).
+
+    OUTPUT
+
+    The RateLimiter object, whose report() shows how each host is doing.
+    """
+
+    global _limiter
+    _limiter = RateLimiter(**settings)
+    return _limiter
+
+
+def disableRateLimit():
+
+    """
+    PURPOSE
+
+    Turns off rate limiting, so that 429s and 503s are just returned as they are.
+    """
+
+    global _limiter
+    _limiter = None
+
+
+def retryAfter(response):
+
+    """
+    PURPOSE
+
+    Reads the Retry-After header of a response, which can either be a number of seconds or a date.
+
+    OUTPUT
+
+    The number of seconds to wait, or None if there isn't a (readable) header
+    """
+
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+_limiter = RateLimiter()
+
+
+class Cassette:
+
+    """
+    PURPOSE
+
+    To benchmark and profile the parsing side of the scrapers, the network needs to be taken out of the picture.
+    In "record" mode, every response that goes through fetch() is saved into a compressed zip archive.
+    In "replay" mode, fetch() serves the responses from that archive instead, without touching the network at all.
+    Urls that were never recorded raise an error, so that a replayed run is exactly the same every time.
+    Normally, this is set up through enableCassette(), and can be used with a "with" block:
+
+    with enableCassette('songs.zip', 'record'):
+        searchSong('Perfect', 'Ed Sheeran')
+
+    PARAMETERS
+
+    path [str]: where the archive is kept
+    mode [str]: "record" or "replay"
+    """
+
+    def __init__(self, path, mode = 'replay'):
+
+        if mode not in ['record', 'replay']:
+            raise Exception("mode must be 'record' or 'replay'")
+
+        self.path = path
+        self.mode = mode
+        self.lock = threading.Lock()
+        if mode == 'record':
+            self.zip = zipfile.ZipFile(path, 'a', compression = zipfile.ZIP_DEFLATED)
+        else:
+            self.zip = zipfile.ZipFile(path, 'r')
+        self.names = set(self.zip.namelist())
+
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha1(url.encode()).hexdigest()
+
+
+    def record(self, url, response):
+
+        """
+        PURPOSE
+
+        Saves a response into the archive. Only the first recording of each url is kept.
+        """
+
+        name = Cassette.key(url)
+        details = json.dumps({"url": url,
+                              "status": response.status_code,
+                              "headers": dict(response.headers),
+                              "encoding": response.encoding})
+        with self.lock:
+            if name not in self.names:
+                self.zip.writestr(name, details.encode() + b'\n' + response.content)
+                self.names.add(name)
+
+
+    def play(self, url):
+
+        """
+        PURPOSE
+
+        Rebuilds the recorded response of a url.
+
+        OUTPUT
+
+        requests.Response object
+        """
+
+        name = Cassette.key(url)
+        if name not in self.names:
+            raise Exception("%s was not recorded in %s" % (url, self.path))
+        with self.lock:
+            details, body = self.zip.read(name).split(b'\n', 1)
+        entry = json.loads(details)
+        entry["body"] = body
+        return ResponseCache.response(entry)
+
+
+    def close(self):
+        with self.lock:
+            self.zip.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        if _cassette is self:
+            disableCassette()
+        else:
+            self.close()
+
+
+def enableCassette(path, mode = 'replay'):
+
+    """
+    PURPOSE
+
+    Starts recording responses into (or replaying them from) an archive, for every request made through fetch().
+    Refer to Cassette.
+
+    OUTPUT
+
+    The Cassette object, which can be used in a "with" block to stop when the block ends.
+    """
+
+    global _cassette
+    disableCassette()
+    _cassette = Cassette(path, mode)
+    return _cassette
+
+
+def disableCassette():
+
+    """
+    PURPOSE
+
+    Stops recording or replaying, and closes the archive.
+    """
+
+    global _cassette
+    if _cassette is not None:
+        _cassette.close()
+    _cassette = None
+
+
+class Profiler:
+
+    """
+    PURPOSE
+
+    When a scrape is slow, it's hard to tell whether it's waiting on the network or stuck parsing.
+    While profiling is turned on (using enableProfiling()), every request records how long each stage took:
+        connect: looking up the host and opening the connection (0 when a pooled connection is reused)
+        ttfb: the time until the first byte of the response came back
+        download: the time taken to download the rest of the body
+        bytes: the size of the body
+        decode: the time taken to decode the body into text
+        parse: the time taken by BeautifulSoup to parse the page
+    Each record is tagged with the domain and the function that asked for the page (like language.JLPTKanjiPage).
+    """
+
+    def __init__(self):
+        self.records = []
+        self.lock = threading.Lock()
+
+
+    def record(self, stage, domain, caller, value):
+        with self.lock:
+            self.records.append((stage, domain, caller, value))
+
+
+    def summary(self, by = ["Stage", "Domain", "Caller"]):
+
+        """
+        PURPOSE
+
+        Summarises the records, giving the count, total, mean and percentiles of each stage.
+
+        PARAMETERS
+
+        by [list of str]: what to group the records by, out of "Stage", "Domain" and "Caller"
+                          For instance, by = ["Stage"] shows at a glance whether the time goes into the network or into parsing.
+
+        OUTPUT
+
+        Dataframe
+        """
+
+        with self.lock:
+            records = pd.DataFrame(self.records, columns = ["Stage", "Domain", "Caller", "Value"]).astype({"Value": float})
+        grouped = records.groupby(by)["Value"]
+        summary = grouped.agg(["count", "sum", "mean"])
+        for q in [50, 90, 99]:
+            summary["p%d" % q] = grouped.quantile(q / 100)
+        return summary.reset_index()
+
+
+    def dump(self, path, raw = False):
+
+        """
+        PURPOSE
+
+        Saves the summary (and, if raw = True, every record) as a JSON file, for comparing between runs.
+        """
+
+        output = {"summary": self.summary().to_dict("records")}
+        if raw:
+            with self.lock:
+                output["records"] = [dict(zip(["Stage", "Domain", "Caller", "Value"], record)) for record in self.records]
+        with open(path, "w") as f:
+            json.dump(output, f, indent = 1)
+
+
+    def clear(self):
+        with self.lock:
+            self.records = []
+
+
+_context = threading.local()
+
+
+def _caller():
+
+    """
+    Finds the function outside of spiderman that asked for the page.
+    Pages fetched in fetchIter()'s threads take the caller of fetchIter() instead.
+    """
+
+    caller = getattr(_context, "caller", None)
+    if caller is not None:
+        return caller
+    frame = sys._getframe(1)
+    while frame is not None:
+        module = frame.f_globals.get("__name__", "")
+        if module != __name__ and module.split(".")[0] not in ["concurrent", "threading", "tqdm"]:
+            return module + "." + frame.f_code.co_name
+        frame = frame.f_back
+    return ""
+
+
+def _timedConnection(*args, **kwargs):
+    start = time.perf_counter()
+    try:
+        return _createConnection(*args, **kwargs)
+    finally:
+        _context.connect = getattr(_context, "connect", 0.0) + time.perf_counter() - start
+
+
+def enableProfiling():
+
+    """
+    PURPOSE
+
+    Turns on profiling for every request made through fetch() and website(). Refer to Profiler.
+
+    OUTPUT
+
+    The Profiler object, whose summary() gives the results.
+    """
+
+    global _profiler
+    urllib3.util.connection.create_connection = _timedConnection
+    _profiler = Profiler()
+    return _profiler
+
+
+def disableProfiling():
+
+    """
+    PURPOSE
+
+    Turns off profiling.
+    """
+
+    global _profiler
+    urllib3.util.connection.create_connection = _createConnection
+    _profiler = None
+
+
+def _profile(stage, url, value):
+    profiler = _profiler
+    if profiler is not None:
+        profiler.record(stage, urlparse(url).netloc, _caller(), value)
+
+
+def fetch(url, headers = None, timeout = None, cache = True):
+
+    """
+    PURPOSE
+
+    Shorthand for a GET request through the shared session.
+    This is what website() uses to download its pages, and it can be used on its own for APIs like LTA's DataMall.
+    If the cache is turned on (using enableCache()), fresh pages are served straight from disk, and stale ones are revalidated.
+    Requests also go through the RateLimiter, and are retried after a pause whenever the host throttles us with a 429 or 503.
+    If a Cassette is turned on (using enableCassette()), responses are recorded into it, or replayed from it without using the network.
+    If profiling is turned on (using enableProfiling()), the time spent on each stage of the request is recorded.
+
+    PARAMETERS
+
+    url [str]: the link to get
+    headers [dict]: any headers to send along with the request
+    timeout [float or tuple]: overrides the default timeout in sessionSettings
+    cache [boolean]: whether this request can use the cache at all (set to False for real-time data, like carpark availability)
+
+    OUTPUT
+
+    requests.Response object
+    """
+
+    cassette = _cassette
+    if cassette is not None and cassette.mode == 'replay':
+        return cassette.play(url)
+
+    response = _fetch(url, headers, timeout, cache)
+
+    if cassette is not None:
+        cassette.record(url, response)
+    return response
+
+
+def _fetch(url, headers, timeout, useCache = True):
+
+    if timeout is None:
+        timeout = sessionSettings["timeout"]
+
+    cache = _cache if useCache else None
+    entry = None
+    if cache is not None:
+        entry = cache.get(url)
+        if entry is not None:
+            if entry["fresh"]:
+                return ResponseCache.response(entry)
+            headers = dict(headers or {})
+            if "ETag" in entry["headers"]:
+                headers["If-None-Match"] = entry["headers"]["ETag"]
+            if "Last-Modified" in entry["headers"]:
+                headers["If-Modified-Since"] = entry["headers"]["Last-Modified"]
+
+    host = urlparse(url).netloc
+    for attempt in range(sessionSettings["retries"] + 1):
+        limiter = _limiter
+        if limiter is not None:
+            limiter.acquire(host)
+        _context.connect = 0.0
+        start = time.perf_counter()
+        response = getSession().get(url, headers = headers, timeout = timeout)
+        if _profiler is not None:
+            ttfb = response.elapsed.total_seconds()
+            _profile("connect", url, _context.connect)
+            _profile("ttfb", url, ttfb)
+            _profile("download", url, max(0.0, time.perf_counter() - start - ttfb))
+            _profile("bytes", url, len(response.content))
+        if response.status_code not in [429, 503]:
+            if limiter is not None:
+                limiter.succeeded(host)
+            break
+        if limiter is None:
+            break
+        limiter.throttled(host, retryAfter(response))
+
+    if cache is not None:
+        if entry is not None and response.status_code == 304:
+            cache.touch(url)
+            return ResponseCache.response(entry)
+        if response.status_code == 200:
+            cache.put(url, response)
+
+    return response
 
 
 def findPreviouses(soup, tag, n):
@@ -16,6 +860,7 @@ def findPreviouses(soup, tag, n):
     However, there often are cases where we need to use this function several times, having nested functions like (find_previous(find_previous(soup))).
     Before I found out about the find_all_previous() function, I needed a shorthand for searching for tags.
     So here I am
+    Now it just uses find_all_previous(), so the document is only gone through once instead of n times.
 
     PARAMETERS
 
@@ -25,12 +870,13 @@ def findPreviouses(soup, tag, n):
 
     OUTPUT
 
-    [BeautifulSoup object]
+    [BeautifulSoup object], or None if there aren't n of them
     """
 
-    for x in range(n):
-        soup = soup.find_previous(tag)
-    return soup
+    if n <= 0:
+        return soup
+    found = soup.find_all_previous(tag, limit = n)
+    return found[n - 1] if len(found) == n else None
 
 
 def findNexts(soup, tag, n):
@@ -42,6 +888,7 @@ def findNexts(soup, tag, n):
     However, there often are cases where we need to use this function several times, having nested functions like (find_next(find_next(soup))).
     Before I found out about the find_all_next() function, I needed a shorthand for searching for tags.
     So here I am
+    Now it just uses find_all_next(), so the document is only gone through once instead of n times.
 
     PARAMETERS
 
@@ -51,12 +898,13 @@ def findNexts(soup, tag, n):
 
     OUTPUT
 
-    BeautifulSoup object
+    BeautifulSoup object, or None if there aren't n of them
     """
 
-    for x in range(n):
-        soup = soup.find_next(tag)
-    return soup
+    if n <= 0:
+        return soup
+    found = soup.find_all_next(tag, limit = n)
+    return found[n - 1] if len(found) == n else None
 
 
 def allstr(soup, joiner=""):
@@ -81,67 +929,500 @@ def allstr(soup, joiner=""):
     return joiner.join(list(soup.stripped_strings))
 
 
-def soupstr(soup):
+def soupstr(soup):
+
+    """
+    PURPOSE
+
+    Similar to the above, soupstr() just converts into a list instead of joining all the strings together.
+
+    PARAMETERS
+
+    soup [BeautifulSoup object]: the soup object that you want to clean
+
+    OUTPUT
+
+    list of str
+    """
+
+    return list(soup.stripped_strings)
+
+
+def loadJson(text):
+
+    """
+    PURPOSE
+
+    json.loads(), but using orjson instead if it is installed, since it is several times faster on big blobs.
+
+    PARAMETERS
+
+    text [str]: the JSON text to decode
+
+    OUTPUT
+
+    The decoded object
+    """
+
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+"""
+PURPOSE
+
+Patterns used by website.embeddedJson() and website.scriptJson() to read the raw html without parsing it.
+"""
+_tagRegex = re.compile(r"""<[a-zA-Z][^\s/>]*(?:\s+[^\s=/>]+(?:\s*=\s*(?:"[^"]*"|'[^']*'|[^\s>]+))?)*\s*/?>""")
+_attrRegex = re.compile(r"""([^\s=/>]+)(?:\s*=\s*("[^"]*"|'[^']*'|[^\s>]+))?""")
+_scriptRegex = re.compile(r"<script[^>]*>(.*?)</script>", re.S | re.I)
+
+
+"""
+PURPOSE
+
+Helpers for website.getTables(), which walks through each table once instead of going through pd.read_html().
+They follow read_html()'s rules for headers, colspans/rowspans, whitespace, missing values and numbers, so that the tables come out the same.
+"""
+_newlineRegex = re.compile('[\n\t]+')
+_whitespaceRegex = re.compile(r'\r+|\s{2,}')
+_hiddenRegex = re.compile(r'display:\s*none')
+_numberRegex = re.compile(r'^[+-]?(\d+|\d{1,3}(,\d{3})+)?(\.\d*)?([eE][+-]?\d+)?$')
+_naValues = {'', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN',
+             '<NA>', 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null'}
+
+
+def _hidden(tag):
+    return 'style' in tag.attrs and _hiddenRegex.search(tag['style']) is not None
+
+
+def _tableRows(table):
+
+    """
+    Splits the rows belonging to this table (and not to tables nested within it) into header and body rows.
+    Like read_html(), the header is the <thead>, or else any rows at the top made up only of <th> cells.
+    """
+
+    header, body, footer = [], [], []
+    for tr in table('tr'):
+        if tr.find_parent('table') is not table or _hidden(tr):
+            continue
+        cells = [cell for cell in tr(['td', 'th'], recursive = False) if not _hidden(cell)]
+        if tr.parent.name == 'thead':
+            header.append(cells)
+        elif tr.parent.name == 'tfoot':
+            footer.append(cells)
+        else:
+            body.append(cells)
+
+    if len(header) == 0:
+        while body and body[0] and all(cell.name == 'th' for cell in body[0]):
+            header.append(body.pop(0))
+
+    return header, body + footer
+
+
+def _tableCell(cell, site, mark, href):
+
+    """
+    Gets the text and links of a cell in one pass.
+    If mark is (hrefOpen, hrefClose), the links are attached to the text like attachHrefs() does.
+    Only <td> cells have their links picked up, same as before.
+    """
+
+    parts = []
+    links = []
+    href = href and cell.name == 'td'
+
+    def walk(tag, parts):
+        for child in tag.children:
+            if isinstance(child, NavigableString):
+                if not isinstance(child, PreformattedString):
+                    parts.append(_newlineRegex.sub('Ǟ', child))
+            elif _hidden(child):
+                continue
+            elif href and child.name == 'a' and child.get('href'):
+                link = website.cleanHref(child['href'], domain = site.domain, url = site.url)
+                links.append(link)
+                if mark:
+                    inner = []
+                    walk(child, inner)
+                    parts.append(''.join(inner) + mark[0] + link + mark[1])
+                else:
+                    walk(child, parts)
+            else:
+                walk(child, parts)
+
+    walk(cell, parts)
+    text = _whitespaceRegex.sub(' ', ''.join(parts).strip())
+
+    try: rowspan = int(cell.get('rowspan') or 1)
+    except ValueError: rowspan = 1
+    try: colspan = int(cell.get('colspan') or 1)
+    except ValueError: colspan = 1
+
+    return text, links, max(rowspan, 1), max(colspan, 1)
+
+
+def _expandSpans(rows):
+
+    """
+    Repeats the cells with colspans/rowspans into every position they cover, the same way read_html() does.
+    """
+
+    expanded = []
+    remainder = []
+    for row in rows:
+        values = []
+        nextRemainder = []
+        index = 0
+        for text, links, rowspan, colspan in row:
+            while remainder and remainder[0][0] <= index:
+                prevIndex, prevValue, prevRowspan = remainder.pop(0)
+                values.append(prevValue)
+                if prevRowspan > 1:
+                    nextRemainder.append((prevIndex, prevValue, prevRowspan - 1))
+                index += 1
+            for i in range(colspan):
+                values.append((text, links))
+                if rowspan > 1:
+                    nextRemainder.append((index, (text, links), rowspan - 1))
+                index += 1
+        for prevIndex, prevValue, prevRowspan in remainder:
+            values.append(prevValue)
+            if prevRowspan > 1:
+                nextRemainder.append((prevIndex, prevValue, prevRowspan - 1))
+        expanded.append(values)
+        remainder = nextRemainder
+
+    while remainder:
+        values = []
+        nextRemainder = []
+        for prevIndex, prevValue, prevRowspan in remainder:
+            values.append(prevValue)
+            if prevRowspan > 1:
+                nextRemainder.append((prevIndex, prevValue, prevRowspan - 1))
+        expanded.append(values)
+        remainder = nextRemainder
+
+    return expanded
+
+
+def _tableColumns(header, width):
+
+    """
+    Names the columns like read_html() does: numbered if there's no header, "Unnamed: i" for blanks, "name.1" for duplicates, and a MultiIndex for several header rows.
+    """
+
+    if len(header) == 0:
+        return list(range(width))
+
+    header = [row + [''] * (width - len(row)) for row in header]
+    if len(header) == 1:
+        columns = [text if text else 'Unnamed: %d' % i for i, text in enumerate(header[0])]
+        seen = {}
+        for i, column in enumerate(columns):
+            if column in seen:
+                seen[column] += 1
+                columns[i] = '%s.%d' % (column, seen[column])
+            else:
+                seen[column] = 0
+        return columns
+
+    return pd.MultiIndex.from_tuples([tuple(text if text else 'Unnamed: %d_level_%d' % (i, level) for level, text in enumerate(column))
+                                      for i, column in enumerate(zip(*header))])
+
+
+def _inferColumn(values):
+
+    """
+    Converts a column of cell texts into numbers if every filled cell is a number, or into True/False if every filled cell is "true" or "false" (in any case), like read_html() does.
+    Missing values (read_html's NaN, which getTables() has always filled in) are left as ''.
+    """
+
+    values = ['' if value in _naValues else value for value in values]
+    filled = [value for value in values if value != '']
+    if len(filled) > 0 and all(value.lower() in ('true', 'false') for value in filled):
+        return [value.lower() == 'true' if value != '' else '' for value in values]
+    numeric = [value != '' and _numberRegex.match(value) is not None and any(c.isdigit() for c in value) for value in values]
+    values = [value.replace(',', '') if isNumber else value for value, isNumber in zip(values, numeric)]
+    filled = [value for value in values if value != '']
+    if len(filled) == 0 or sum(numeric) != len(filled):
+        return values
+
+    if len(filled) == len(values) and not any(c in value for value in filled for c in '.eE'):
+        return [int(value) for value in values]
+    return [float(value) if value != '' else '' for value in values]
+
+
+"""
+PURPOSE
+
+The parser that website() uses by default.
+'html.parser' comes with Python, but 'lxml' is several times faster if it is installed.
+"""
+defaultParser = 'html.parser'
+
+
+class website():
+
+    """
+    PURPOSE
+
+    A class to represent data retrieved from a website.
+    Functions can also be applied to extract more information.
+
+    DEFAULT ATTRIBUTES
+
+    url [str]: the link itself
+    domain [str]: the domain link
+    text [str]: the raw contents of the page
+    html [BeautifulSoup object]: the contents of the page, in html format
+    hrefs [list of str]: all the outward links of the page
+
+    Parsing the page takes up most of the time once the pages are fetched concurrently, and most callers only read a tiny part of each page.
+    So html and hrefs are only worked out the first time they are used.
+
+    OUTPUT
+
+    str
+    """
+    
+    def __init__(self, url, parser = None, only = None, text = None):
+        
+        """
+        PARAMETERS
+
+        url [str]: the link to the site
+        parser [str]: the BeautifulSoup parser to use, like 'html.parser' or 'lxml' (defaults to defaultParser)
+        only [str, list of str, dict or SoupStrainer]: restricts parsing to only the tags you need, which is much faster for big pages
+                                                       A str or list is taken as tag names (only = ['table', 'a']).
+                                                       A dict is passed into a SoupStrainer (only = {'class_': 'js-store'}).
+        text [str]: the contents of the page, if it has already been downloaded (like in pipeline()), so that it isn't fetched again
+        """
+        self.url = url
+        self.domain = get_tld(url,as_object = True).fld
+        self.parser = parser or defaultParser
+        self.only = only
+        if text is None:
+            response = fetch(url)
+            start = time.perf_counter()
+            text = response.text
+            _profile("decode", url, time.perf_counter() - start)
+        self.text = text
+        self._html = None
+        self._hrefs = None
+        self._json = {}
+
+
+    @property
+    def html(self):
+        if self._html is None:
+            start = time.perf_counter()
+            self._html = bs(self.text, self.parser, parse_only = self.strainer())
+            _profile("parse", self.url, time.perf_counter() - start)
+        return self._html
+
+
+    @html.setter
+    def html(self, html):
+        self._html = html
+
+
+    @property
+    def hrefs(self):
+        if self._hrefs is None:
+            self._hrefs = [a['href'] for a in self.html(href=True)]
+        return self._hrefs
+
+
+    @hrefs.setter
+    def hrefs(self, hrefs):
+        self._hrefs = hrefs
+
+
+    def embeddedJson(self, class_ = 'js-store', attr = 'data-content'):
+
+        """
+        PURPOSE
+
+        Some sites (like ultimate-guitar) put all of the page's data as a JSON blob inside an attribute, like <div class="js-store" data-content="{...}">.
+        Parsing the whole page just to get that one attribute is a waste, so this finds the element straight from the raw html.
+        The blob is only decoded once, and the result is kept for the next time it is asked for.
+
+        PARAMETERS
+
+        class_ [str]: the class of the element holding the blob
+        attr [str]: the attribute holding the blob
+
+        OUTPUT
+
+        The decoded JSON object
+        """
+
+        key = ('attr', class_, attr)
+        if key not in self._json:
+            position = self.text.find(class_)
+            while position != -1:
+                tag = _tagRegex.match(self.text, self.text.rfind('<', 0, position))
+                if tag and tag.end() > position:
+                    attrs = {name.lower(): value for name, value in _attrRegex.findall(tag.group()[1:])}
+                    if class_ in attrs.get('class', '').strip('"\'').split() and attr in attrs:
+                        self._json[key] = loadJson(html.unescape(attrs[attr].strip('"\'')))
+                        break
+                position = self.text.find(class_, position + 1)
+            else:
+                raise Exception("no element with class '%s' and attribute '%s' found" % (class_, attr))
+        return self._json[key]
+
+
+    def scriptJson(self, contains, pattern, unescape = False):
+
+        """
+        PURPOSE
+
+        Some sites keep their data as JavaScript objects within a <script> tag instead.
+        This finds the first script containing a certain search term, then decodes every match of the pattern within it.
+        All the matches are decoded together in one go, and the result is kept for the next time it is asked for.
+
+        PARAMETERS
+
+        contains [str]: a regex that the script has to contain (like 'words')
+        pattern [str]: a regex matching each JSON object in the script (like '{"id".*?}')
+        unescape [boolean]: whether to remove all the backslashes from the script first, for when the objects are within an escaped string
+
+        OUTPUT
+
+        List of decoded objects
+        """
+
+        key = ('script', contains, pattern, unescape)
+        if key not in self._json:
+            for script in _scriptRegex.findall(self.text):
+                if re.search(contains, script):
+                    break
+            else:
+                raise Exception("no script containing '%s' found" % contains)
+
+            if unescape:
+                script = script.replace('\\', '')
+            matches = re.findall(pattern, script)
+            try:
+                self._json[key] = loadJson('[' + ','.join(matches) + ']')
+            except ValueError:
+                self._json[key] = [ast.literal_eval(match) for match in matches]
+        return self._json[key]
+
+
+    def strainer(self):
+
+        """
+        PURPOSE
+
+        Converts the only parameter into a SoupStrainer for BeautifulSoup.
+
+        OUTPUT
+
+        SoupStrainer object, or None to parse everything
+        """
+
+        if self.only is None or isinstance(self.only, SoupStrainer):
+            return self.only
+        elif isinstance(self.only, dict):
+            return SoupStrainer(**self.only)
+        else:
+            return SoupStrainer(self.only)
+        
+
+    def __str__(self):
+
+        """
+        PURPOSE
 
-    """
-    PURPOSE
+        When the object itself is called, return a dictionary containing its url and hrefs.
+        """
+        
+        return {"url":self.url,"hrefs":self.hrefs}
 
-    Similar to the above, soupstr() just converts into a list instead of joining all the strings together.
 
-    PARAMETERS
+    @classmethod
+    def fetchMany(cls, urls, workers = 16, perDomain = 4, progress = False, **kwargs):
 
-    soup [BeautifulSoup object]: the soup object that you want to clean
+        """
+        PURPOSE
 
-    OUTPUT
+        Fetching pages one by one is slow, since most of the time is spent waiting on the network.
+        This gets a whole list of pages at once using a pool of threads, while capping the number of requests that go to any one host at the same time.
+        If a page fails, the error is kept in its place so that one bad link doesn't stop the whole batch.
 
-    list of str
-    """
+        PARAMETERS
 
-    return list(soup.stripped_strings)
+        urls [list of str]: the links to get
+        workers [int]: the total number of pages to get at the same time
+        perDomain [int]: the maximum number of pages to get from the same host at the same time
+        progress [boolean]: whether to show a tqdm progress bar
+        kwargs: passed on to website(), like parser or only
 
+        OUTPUT
 
-class website():
+        List of website objects, in the same order as urls.
+        For the pages that failed, the Exception is returned in place of the website object.
+        """
 
-    """
-    PURPOSE
+        return list(cls.fetchIter(urls, workers = workers, perDomain = perDomain, progress = progress, **kwargs))
 
-    A class to represent data retrieved from a website.
-    Functions can also be applied to extract more information.
 
-    DEFAULT ATTRIBUTES
+    @classmethod
+    def fetchIter(cls, urls, workers = 16, perDomain = 4, progress = False, **kwargs):
 
-    url [str]: the link itself
-    domain [str]: the domain link
-    html [BeautifulSoup object]: the contents of the page, in html format
-    hrefs [list of str]: all the outward links of the page
+        """
+        PURPOSE
 
-    OUTPUT
+        The same as fetchMany(), except that each page is given back as soon as it (and every page before it) is done, instead of all at the end.
+        This is useful for saving progress along the way, like with a JobStore.
+        If the loop is stopped early, the pages that haven't started are cancelled.
 
-    str
-    """
-    
-    def __init__(self, url):
-        
-        """
         PARAMETERS
 
-        url [str]: the link to the site
-        """
-        self.url = url
-        self.domain = get_tld(url,as_object = True).fld
-        self.html = bs(requests.get(url).text,'html.parser')
-        self.hrefs = [a['href'] for a in self.html(href=True)]
-        
+        Refer to fetchMany()
 
-    def __str__(self):
+        OUTPUT
 
+        Generator of website objects (or Exceptions), in the same order as urls
         """
-        PURPOSE
 
-        When the object itself is called, return a dictionary containing its url and hrefs.
-        """
-        
-        return {"url":self.url,"hrefs":self.hrefs}
+        urls = list(urls)
+        semaphores = {}
+        lock = threading.Lock()
+        caller = _caller() if _profiler is not None else None
+
+        def get(url):
+            _context.caller = caller
+            try:
+                host = urlparse(url).netloc
+                with lock:
+                    if host not in semaphores:
+                        semaphores[host] = threading.BoundedSemaphore(perDomain)
+                with semaphores[host]:
+                    return cls(url, **kwargs)
+            except Exception as e:
+                return e
+
+        pool = ThreadPoolExecutor(max_workers = workers)
+        futures = []
+        try:
+            futures = [pool.submit(get, url) for url in urls]
+            results = (future.result() for future in futures)
+            if progress:
+                results = tqdm(results, total = len(urls))
+            for result in results:
+                yield result
+        finally:
+            # shutdown(cancel_futures = True) needs Python 3.9, so the pages that haven't started are cancelled one by one
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait = False)
 
         
     def attachHrefs(self, hrefOpen = '(href', hrefClose = 'href)', subset = None, edit = False):
@@ -187,12 +1468,16 @@ class website():
         PURPOSE
 
         The simple function is to retrieve all the tables within the html.
-        That simple task is done using Pandas' read_html() function.
+        That simple task used to be done using Pandas' read_html() function.
         However, combining it with the previously discussed function yields more useful results.
         You see, as it stands, quite alot of tables contain links within their cells and as such, the pd.read_html() function doesn't work as well.
         So, this function rips the links out of their "a" tags and places them either into separate columns, or attached to the text.
         Under the former, for each row, all the links found are gathered into a single column.
 
+        On big pages (like the lists of MRT stations on Wikipedia), copying the whole soup, re-parsing the tables and running regexes on every cell was very slow.
+        So now, each table is walked through once, picking up the text and links of each cell in the same pass, and the dataframes are built directly.
+        The headers, colspans/rowspans and numbers are handled the same way read_html() does.
+
 
         Another purpose of this function is to combine tables with identical column headers.
         Under the condition merge = True, the code looks for groups of tables with the exact same set of column headers.
@@ -206,29 +1491,41 @@ class website():
         href [boolean]: whether to include the links, or too discard them altogether
         hrefSeparate [boolean]: whether to separate the hrefs into a separate column
         edit [boolean]: there are two different places where html content is stored (self.html and self.editHtml). As such, this parameter will choose which one to use.
+                        The html itself is never changed by this function.
 
         OUTPUT
 
+        self.tables contains all the tables, as pandas dataframes.
         Under merge = True, two new attributes will be added: self.mergedTables and self.uniqueTables.
         mergedTables contains the tables that can be merged, while uniqueTables contains the rest.
         """
-            
-        if href:
-            self.attachHrefs(subset = 'td', hrefOpen = hrefOpen, hrefClose = hrefClose, edit = False)
-        
-        if edit:
-            self.tables = pd.read_html(re.sub('[\n\t]+','Ǟ',str(self.html('table'))))
+
+        if edit or not hasattr(self, 'editHtml'):
+            html = self.html
         else:
-            self.tables = pd.read_html(re.sub('[\n\t]+','Ǟ',str(self.editHtml('table'))))
-        
-        self.tables = [table.fillna('') for table in self.tables]
-            
-        if hrefSeparate:
-            
-            for table in self.tables:
-                
-                table['Links'] = table.apply(lambda x: '\n'.join(re.findall(re.compile(hrefOpen + "(.*?)" + hrefClose),''.join(list(x)))),axis=1)
-                table.loc[:,table.columns != 'Links'] = table.loc[:,table.columns != 'Links'].applymap(lambda x: re.sub(re.compile(hrefOpen + ".*?" + hrefClose),'',x))
+            html = self.editHtml
+
+        mark = (hrefOpen, hrefClose) if href and not hrefSeparate else None
+
+        self.tables = []
+        for table in html('table'):
+            header, body = _tableRows(table)
+            header = _expandSpans([[_tableCell(cell, self, None, False) for cell in row] for row in header])
+            body = _expandSpans([[_tableCell(cell, self, mark, href) for cell in row] for row in body])
+            body = [row for row in body if len(row) > 1 or (len(row) == 1 and row[0][0].strip())]
+            if len(body) == 0:
+                continue
+
+            width = max(len(row) for row in header + body)
+            columns = _tableColumns([[text for text, links in row] for row in header], width)
+            data = [[text for text, links in row] + [''] * (width - len(row)) for row in body]
+            data = list(zip(*data))
+
+            frame = pd.DataFrame({i: _inferColumn(list(column)) for i, column in enumerate(data)})
+            frame.columns = columns
+            if hrefSeparate:
+                frame['Links'] = ['\n'.join(link for text, links in row for link in links) for row in body]
+            self.tables.append(frame)
 
         self.mergedTables = []
         self.uniqueTables = []
@@ -278,11 +1575,12 @@ class website():
             self.rawLists = self.editHtml(re.compile('[oi]l'))
             
         self.lists = []
+        findHrefs = re.compile(re.escape(hrefOpen) + "(.*?)" + re.escape(hrefClose))
         
         for rawList in self.rawLists:
             ss = pd.DataFrame([li.get_text() for li in rawList('li')], columns = ['Text'])
-            ss['Hrefs'] = ss['Text'].apply(lambda x: '\n'.join(re.findall(re.compile(hrefOpen + "(.*?)" + hrefClose),x)))
-            ss['Text'] = ss['Text'].apply(lambda x: re.sub(re.compile(hrefOpen + ".*?" + hrefClose),'',x))
+            ss['Hrefs'] = ss['Text'].apply(lambda x: '\n'.join(findHrefs.findall(x)))
+            ss['Text'] = ss['Text'].apply(lambda x: findHrefs.sub('',x))
             self.lists.append(ss)
         
 
@@ -321,7 +1619,6 @@ class website():
         return href
     
 
-    @classmethod
     def cleanHrefs(self):
 
         """
@@ -358,4 +1655,546 @@ class website():
         self.allHrefs = list(set(self.allHrefs))
         self.selfHrefs = list(set(self.selfHrefs))
         self.intHrefs = list(set(self.intHrefs))
-        self.extHrefs = list(set(self.extHrefs))
\ No newline at end of file
+        self.extHrefs = list(set(self.extHrefs))
+
+
+class Spec:
+
+    """
+    PURPOSE
+
+    Most of the scrapers used to find each field with its own search (html(text=re.compile(...)), find_next() etc.), each of which goes through the whole page again.
+    A Spec describes all the fields of a page up front and compiles them once.
+    Applying it to a page then finds every field in a single pass through the document, stopping as soon as everything has been found.
+
+    kanjiSpec = Spec({"meaning": {"string": "Meaning: ", "default": ""},
+                      "rank": {"string": "^2,500$", "previous": "b", "n": 2, "get": lambda x: int(allstr(x)), "default": 0},
+                      "sentences": {"tag": "h5", "all": True, "get": lambda x: allstr(x)}})
+    fields = kanjiSpec.extract(site)
+
+    PARAMETERS
+
+    fields [dict]: the name of each field, and how to find it, using these keys:
+        select [str]: a CSS selector that the element has to match
+        tag [str, list of str]: the tag name(s) that the element has to have (faster than select)
+        class_ [str]: a class that the element has to have (faster than select)
+        string [str]: a regex that a piece of text has to contain, for fields that are found by their text instead of by their element
+        all [boolean]: whether to get every match, instead of just the first one
+        previous / next [str, list of str]: from the match, go to the previous/next element with this tag
+        n [int]: the number of times to go to the previous/next element (default 1)
+        get [function]: what to take from the element (defaults to the element itself)
+                        Under all = True, the matches where this fails are skipped.
+        default: what to give if the field is not found, or if get fails (defaults to None, or [] under all = True)
+    """
+
+    def __init__(self, fields):
+
+        self.tagFields = []
+        self.stringFields = []
+        self.fields = {}
+
+        for name, field in fields.items():
+            field = dict(field)
+            field["name"] = name
+            if "string" in field:
+                field["regex"] = re.compile(field["string"])
+                self.stringFields.append(field)
+            elif any(key in field for key in ["select", "tag", "class_"]):
+                if "select" in field:
+                    field["selector"] = soupsieve.compile(field["select"])
+                if type(field.get("tag")) == str:
+                    field["tag"] = [field["tag"]]
+                self.tagFields.append(field)
+            else:
+                raise Exception("field '%s' needs one of select, tag, class_ or string" % name)
+            self.fields[name] = field
+
+
+    @staticmethod
+    def _matches(field, tag):
+        if "tag" in field and tag.name not in field["tag"]:
+            return False
+        if "class_" in field and field["class_"] not in tag.get("class", []):
+            return False
+        if "selector" in field and not field["selector"].match(tag):
+            return False
+        return True
+
+
+    def extract(self, soup):
+
+        """
+        PURPOSE
+
+        Applies the spec to a page.
+
+        PARAMETERS
+
+        soup [BeautifulSoup object or website object]: the page
+
+        OUTPUT
+
+        Dictionary of field name to value
+        """
+
+        if isinstance(soup, website):
+            soup = soup.html
+
+        matches = {name: [] for name in self.fields}
+        remaining = set(name for name, field in self.fields.items() if not field.get("all"))
+
+        for node in soup.descendants:
+            if isinstance(node, NavigableString):
+                if isinstance(node, PreformattedString):
+                    continue
+                fields = self.stringFields
+                found = [field for field in fields if (field.get("all") or not matches[field["name"]]) and field["regex"].search(node)]
+            else:
+                fields = self.tagFields
+                found = [field for field in fields if (field.get("all") or not matches[field["name"]]) and Spec._matches(field, node)]
+            for field in found:
+                matches[field["name"]].append(node)
+                remaining.discard(field["name"])
+            if not remaining and all(not field.get("all") for field in self.fields.values()):
+                break
+
+        return {name: self._value(field, matches[name]) for name, field in self.fields.items()}
+
+
+    def _value(self, field, nodes):
+
+        def resolve(node):
+            if "previous" in field:
+                node = findPreviouses(node, field["previous"], field.get("n", 1))
+            elif "next" in field:
+                node = findNexts(node, field["next"], field.get("n", 1))
+            if node is None:
+                raise Exception("nothing to navigate to")
+            return field["get"](node) if "get" in field else node
+
+        if field.get("all"):
+            values = []
+            for node in nodes:
+                try: values.append(resolve(node))
+                except Exception: continue
+            return values if values else field.get("default", [])
+
+        try: return resolve(nodes[0])
+        except Exception: return field.get("default")
+
+
+def _extractWorker(extract, url, text, kwargs):
+    return extract(url, website(url, text = text, **kwargs))
+
+
+def pipeline(urls, extract, processes = True, fetchWorkers = 16, parseWorkers = None, perDomain = 4, queueSize = 64, progress = False, **kwargs):
+
+    """
+    PURPOSE
+
+    Fetching pages in threads only goes so far, since parsing them with BeautifulSoup (and walking through them) is CPU-bound and holds the GIL.
+    So this splits the work into two stages:
+        A pool of threads downloads the raw html of each page.
+        A pool of processes builds the website objects and runs the extraction function on them, using every core.
+    The two stages are joined by a bounded queue, so the downloads pause whenever the parsing falls behind, instead of piling up in memory.
+
+    for url, lessons in pipeline(links, japaneseLesson):
+        ...
+
+    PARAMETERS
+
+    urls [list of str]: the links to get
+    extract [function]: takes (url, website object) and returns plain data (dicts, lists, strs...)
+                        Since it is sent to other processes, it has to be a normal top-level function (not a lambda), like japaneseLesson or koreanLesson.
+    processes [boolean]: whether to use the pool of processes at all
+                         If False, pages are fetched using website.fetchIter() and extracted one by one in this process instead.
+    fetchWorkers [int]: the number of pages to download at the same time
+    parseWorkers [int]: the number of processes (defaults to the number of cores)
+    perDomain [int]: the maximum number of pages to download from the same host at the same time
+    queueSize [int]: the maximum number of pages waiting to be parsed
+    progress [boolean]: whether to show a tqdm progress bar
+    kwargs: passed on to website(), like parser or only
+
+    OUTPUT
+
+    Generator of (url, result) tuples.
+    If a page fails to download or extract, the Exception is given in place of its result.
+    Under processes = True, results come out in the order they finish. Otherwise, they come out in the same order as urls.
+    """
+
+    urls = list(urls)
+
+    if not processes:
+        for url, site in zip(urls, website.fetchIter(urls, workers = fetchWorkers, perDomain = perDomain, progress = progress, **kwargs)):
+            if isinstance(site, Exception):
+                yield url, site
+                continue
+            try:
+                yield url, extract(url, site)
+            except Exception as e:
+                yield url, e
+        return
+
+    todo = queue.Queue()
+    for url in urls:
+        todo.put(url)
+    pages = queue.Queue(maxsize = queueSize)
+    stop = threading.Event()
+    semaphores = {}
+    lock = threading.Lock()
+
+    def download():
+        while not stop.is_set():
+            try:
+                url = todo.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                host = urlparse(url).netloc
+                with lock:
+                    if host not in semaphores:
+                        semaphores[host] = threading.BoundedSemaphore(perDomain)
+                with semaphores[host]:
+                    item = (url, fetch(url).text)
+            except Exception as e:
+                item = (url, e)
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout = 0.1)
+                    break
+                except queue.Full:
+                    continue
+
+    # the processes have to be started before the download threads, since forking while another thread holds a lock
+    # (the session's, the rate limiter's, the queue's...) leaves that lock held forever in the child
+    # under fork, every worker is started on the first submit, so running one tiny job here starts them all
+    pool = ProcessPoolExecutor(max_workers = parseWorkers)
+    try:
+        pool.submit(int).result()
+    except BaseException:
+        pool.shutdown(wait = False)
+        raise
+
+    threads = [threading.Thread(target = download, daemon = True) for i in range(fetchWorkers)]
+    for thread in threads:
+        thread.start()
+
+    bar = tqdm(total = len(urls)) if progress else None
+    inFlight = {}
+    received = 0
+    try:
+        while received < len(urls) or inFlight:
+            while received < len(urls) and len(inFlight) < queueSize:
+                try:
+                    url, text = pages.get(timeout = 0.05) if inFlight else pages.get()
+                except queue.Empty:
+                    break
+                received += 1
+                if isinstance(text, Exception):
+                    if bar: bar.update()
+                    yield url, text
+                else:
+                    inFlight[pool.submit(_extractWorker, extract, url, text, kwargs)] = url
+
+            if inFlight:
+                done, notDone = wait(inFlight, timeout = 0.05, return_when = FIRST_COMPLETED)
+                for future in done:
+                    url = inFlight.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        result = e
+                    if bar: bar.update()
+                    yield url, result
+    finally:
+        stop.set()
+        # shutdown(cancel_futures = True) needs Python 3.9, so the pages waiting to be parsed are cancelled one by one
+        for future in inFlight:
+            future.cancel()
+        pool.shutdown(wait = False)
+        if bar: bar.close()
+
+
+
+def normaliseUrl(url):
+
+    """
+    PURPOSE
+
+    The same page can be linked to in many different ways ("HTTP://Site.com:80/a?b=1&a=2#top" and "http://site.com/a?a=2&b=1" for instance).
+    This converts a url into one standard form, so that pages aren't visited twice.
+    The scheme and host are lowercased, default ports and fragments are dropped, and the query parameters are sorted.
+
+    PARAMETERS
+
+    url [str]: the url to normalise
+
+    OUTPUT
+
+    str
+    """
+
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').lower()
+    if parts.port and (scheme, parts.port) not in [('http', 80), ('https', 443)]:
+        host += ':%d' % parts.port
+    query = urlencode(sorted(parse_qsl(parts.query, keep_blank_values = True)))
+    return urlunsplit((scheme, host, parts.path or '/', query, ''))
+
+
+class BloomFilter:
+
+    """
+    PURPOSE
+
+    A set that only remembers whether it has probably seen something before, using a fixed amount of memory.
+    For a million urls at a 0.1% error rate, this takes less than 2MB, compared to the hundreds of MB a set of strings would.
+    The catch is that, once in a while (errorRate), something new is mistaken as already seen.
+
+    PARAMETERS
+
+    capacity [int]: the number of items you expect to add
+    errorRate [float]: the chance of mistaking a new item as already seen, once capacity items have been added
+    """
+
+    def __init__(self, capacity = 10 ** 6, errorRate = 0.001):
+
+        self.size = max(8, int(-capacity * math.log(errorRate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+
+    def _positions(self, item):
+        digest = hashlib.blake2b(item.encode(), digest_size = 16).digest()
+        a = int.from_bytes(digest[:8], 'little')
+        b = int.from_bytes(digest[8:], 'little') | 1
+        return [(a + i * b) % self.size for i in range(self.hashes)]
+
+
+    def __contains__(self, item):
+        return all(self.bits[i >> 3] & (1 << (i & 7)) for i in self._positions(item))
+
+
+    def add(self, item):
+
+        """
+        PURPOSE
+
+        Adds an item to the filter.
+
+        OUTPUT
+
+        True if the item was new, False if it (probably) had been added before
+        """
+
+        new = False
+        for i in self._positions(item):
+            if not self.bits[i >> 3] & (1 << (i & 7)):
+                self.bits[i >> 3] |= 1 << (i & 7)
+                new = True
+        self.count += new
+        return new
+
+
+    def __len__(self):
+        return self.count
+
+
+class Crawler:
+
+    """
+    PURPOSE
+
+    Walks through a site starting from a few pages, following the links it finds.
+    Every url is normalised before going into the frontier, so each page is only fetched once, no matter how many times it is linked to.
+    Pages are fetched in batches using website.fetchMany(), and robots.txt is checked before anything is fetched.
+
+    for url, lessons in Crawler('https://www.howtostudykorean.com/other-stuff/lesson-list/', parse = koreanLesson, follow = 'lesson-[0-9]', maxDepth = 1).crawl():
+        ...
+
+    PARAMETERS
+
+    seeds [str, list of str]: the pages to start from
+    parse [function]: what to do with each page, taking (url, website object) and returning anything
+                      If not given, the website object itself is returned.
+    follow [str]: a regex that a link must contain to be followed
+    maxDepth [int]: how many links away from the seeds to go
+    domains [list of str]: the domains that the crawler can go to (defaults to the domains of the seeds)
+    maxPages [int]: the maximum number of pages to fetch
+    robots [boolean]: whether to obey robots.txt
+    userAgent [str]: the user agent to check robots.txt against
+    bloom [boolean]: whether to remember the urls seen using a BloomFilter instead of a set, for very big crawls
+    capacity [int]: the number of urls that the BloomFilter is sized for
+    workers [int]: refer to website.fetchMany()
+    perDomain [int]: refer to website.fetchMany()
+    batchSize [int]: the number of pages fetched in each batch
+    kwargs: passed on to website(), like parser or only
+
+    OUTPUT
+
+    self.errors contains the (url, Exception) of every page that could not be fetched or parsed.
+    """
+
+    def __init__(self, seeds, parse = None, follow = None, maxDepth = 2, domains = None, maxPages = None,
+                 robots = True, userAgent = '*', bloom = False, capacity = 10 ** 6,
+                 workers = 16, perDomain = 4, batchSize = 64, **kwargs):
+
+        if type(seeds) == str:
+            seeds = [seeds]
+
+        self.parse = parse
+        self.follow = re.compile(follow) if follow else None
+        self.maxDepth = maxDepth
+        self.domains = set(domains) if domains else set(get_tld(seed, as_object = True).fld for seed in seeds)
+        self.maxPages = maxPages
+        self.robots = robots
+        self.userAgent = userAgent
+        self.workers = workers
+        self.perDomain = perDomain
+        self.batchSize = batchSize
+        self.kwargs = kwargs
+
+        self.seen = BloomFilter(capacity) if bloom else set()
+        self.frontier = deque()
+        self.robotParsers = {}
+        self.pages = 0
+        self.errors = []
+
+        for seed in seeds:
+            self.push(seed, 0)
+
+
+    @staticmethod
+    def key(url):
+
+        """
+        PURPOSE
+
+        The key used to tell whether a url has been seen before.
+        http and https versions of a page are treated as the same page.
+        """
+
+        return normaliseUrl(url).split('://', 1)[-1]
+
+
+    def inScope(self, url):
+
+        """
+        PURPOSE
+
+        Checks whether a url is within the domains of the crawl.
+        """
+
+        if urlsplit(url).scheme not in ['http', 'https']:
+            return False
+        tld = get_tld(url, as_object = True, fail_silently = True)
+        return tld is not None and tld.fld in self.domains
+
+
+    def push(self, url, depth):
+
+        """
+        PURPOSE
+
+        Adds a url to the frontier, if it's within scope and hasn't been seen before.
+
+        OUTPUT
+
+        True if it was added
+        """
+
+        if depth > self.maxDepth or not self.inScope(url):
+            return False
+        url = normaliseUrl(url)
+        key = Crawler.key(url)
+        if isinstance(self.seen, BloomFilter):
+            if not self.seen.add(key):
+                return False
+        elif key in self.seen:
+            return False
+        else:
+            self.seen.add(key)
+        self.frontier.append((url, depth))
+        return True
+
+
+    def allowed(self, url):
+
+        """
+        PURPOSE
+
+        Checks the site's robots.txt, which is only fetched once per host.
+        If the robots.txt can't be fetched, everything is allowed.
+        """
+
+        if not self.robots:
+            return True
+        parts = urlsplit(url)
+        host = parts.scheme + '://' + parts.netloc
+        if host not in self.robotParsers:
+            parser = RobotFileParser()
+            try:
+                response = fetch(host + '/robots.txt')
+                parser.parse(response.text.splitlines() if response.status_code == 200 else [])
+            except Exception:
+                parser.parse([])
+            self.robotParsers[host] = parser
+        return self.robotParsers[host].can_fetch(self.userAgent, url)
+
+
+    def links(self, site):
+
+        """
+        PURPOSE
+
+        Gets all the links on a page that should be followed, as full urls.
+        """
+
+        links = []
+        for href in site.hrefs:
+            link = urljoin(site.url, href).split('#')[0]
+            if self.follow is None or self.follow.search(link):
+                links.append(link)
+        return links
+
+
+    def crawl(self):
+
+        """
+        PURPOSE
+
+        Runs the crawl, yielding each page as soon as its batch is done.
+
+        OUTPUT
+
+        Generator of (url, result) tuples, where result is the output of parse (or the website object)
+        """
+
+        while self.frontier and (self.maxPages is None or self.pages < self.maxPages):
+
+            batch = []
+            while self.frontier and len(batch) < self.batchSize and (self.maxPages is None or self.pages + len(batch) < self.maxPages):
+                url, depth = self.frontier.popleft()
+                if self.allowed(url):
+                    batch.append((url, depth))
+            if len(batch) == 0:
+                continue
+
+            sites = website.fetchMany([url for url, depth in batch], workers = self.workers, perDomain = self.perDomain, **self.kwargs)
+            self.pages += len(batch)
+
+            for (url, depth), site in zip(batch, sites):
+                if isinstance(site, Exception):
+                    self.errors.append((url, site))
+                    continue
+                try:
+                    result = self.parse(url, site) if self.parse else site
+                except Exception as e:
+                    self.errors.append((url, e))
+                    continue
+                if depth < self.maxDepth:
+                    for link in self.links(site):
+                        self.push(link, depth + 1)
+                yield url, result
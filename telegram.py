@@ -3,7 +3,7 @@ from datetime import datetime as dt
 from datetime import timedelta as td
 import numpy as np
 import json
-import requests
+from .spiderman import getSession, sessionSettings
 
 def getChatIds(botId, onlyId = False):
     """
@@ -21,7 +21,9 @@ def getChatIds(botId, onlyId = False):
 
     List of unique ids.
     """
-    data = json.loads(requests.get(f'https://api.telegram.org/bot{botId}/getUpdates').text)
+    # this goes straight through the session rather than fetch(), so that updates are never served from the cache
+    # and the bot token never gets written into the cache or a cassette
+    data = json.loads(getSession().get(f'https://api.telegram.org/bot{botId}/getUpdates', timeout = sessionSettings["timeout"]).text)
     if onlyId:
         return list(set(x['message']['chat']['id'] for x in data['result']))
     else:
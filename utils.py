@@ -1,9 +1,16 @@
 import re
 import pandas as pd
+import numpy as np
 from math import sin, cos, atan2, radians, sqrt
 from .spiderman import *
 import json
-import requests
+import sqlite3
+import threading
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from tqdm import tqdm
 
 
 """
@@ -16,29 +23,72 @@ So to more easily find them, this is shorthand for the whole collection of chara
 chineseRegex = r'[\u4e00-\u9fff]+'
 
 
-def postcodeCoords(location):
+def postcodeCoords(location, index = None):
     """
     PURPOSE
 
     This function uses the google search function to search for a particular location.
     This would return the latitude and longitude of the location, if it goes smoothly.
     This function is quite primitive, as such, I mostly use it to get the locations of postal codes in Singapore, using search parameters like "Singapore 410230"
+    If a PostcodeIndex (from geo) is given, the postcode in the location is looked up there instead, and Google is only searched if it isn't in the index.
+    For a lot of postcodes at once, use the index's lookup() directly.
 
     PARAMETERS
 
     location [str]: input the location of search
+    index [PostcodeIndex]: a local index of postcodes to look in first
 
     OUTPUT
 
     A tuple containing the lat and the long of the location searched.
     If not found, return (0,0)
     """
+    if index is not None:
+        postcode = re.findall(r"\b\d{6}\b", str(location))
+        if postcode:
+            lats, longs = index.coords(postcode[:1])
+            if not np.isnan(lats[0]):
+                return (float(lats[0]), float(longs[0]))
     try:
-        return (float(x) for x in re.findall(r"\d+\.\d+", website(f"https://www.google.com/search?q={'+'.join(location.split())}+coordinates").html.find(class_="BNeawe iBp4i AP7Wnd").string))
+        return tuple(float(x) for x in re.findall(r"\d+\.\d+", website(f"https://www.google.com/search?q={'+'.join(location.split())}+coordinates").html.find(class_="BNeawe iBp4i AP7Wnd").string))
     except:
         return (0,0)
 
 
+"""
+PURPOSE
+
+The OneMap search API used by latlong() and latlongMany().
+This can be pointed somewhere else, like a local server that stands in for OneMap when testing.
+"""
+oneMapUrl = "https://developers.onemap.sg/commonapi/search"
+
+
+def _normaliseLocation(location):
+    return " ".join(str(location).split()).upper()
+
+
+def _oneMap(location, baseUrl = None):
+    """
+    PURPOSE
+
+    Searches OneMap for a location, and takes the first result.
+
+    OUTPUT
+
+    Dictionary with the lat, long and postal code of the location, or None if OneMap found nothing.
+    Errors with the request itself are raised.
+    """
+    response = fetch((baseUrl or oneMapUrl) + "?" + urlencode({"searchVal": location, "returnGeom": "Y", "getAddrDetails": "Y"}))
+    response.raise_for_status()
+    results = json.loads(response.text)["results"]
+    if len(results) == 0:
+        return None
+    return {"lat": float(results[0]["LATITUDE"]),
+            "long": float(results[0]["LONGITUDE"]),
+            "postal": results[0].get("POSTAL")}
+
+
 def latlong(location):
     """
     PURPOSE
@@ -56,14 +106,77 @@ def latlong(location):
     If not found, return (0,0)
     """
     try:
-        coords = json.loads(requests.get(f"https://developers.onemap.sg/commonapi/search?searchVal={'+'.join(location.split())}&returnGeom=Y&getAddrDetails=Y").text)["results"][0]
-        lat, long = float(coords["LATITUDE"]), float(coords["LONGITUDE"])
-        return (lat,long)
+        coords = _oneMap(" ".join(location.split()))
+        return (coords["lat"],coords["long"])
     except:
         print(location,"could not be found.")
         return (0,0)
 
 
+def latlongMany(locations, store = None, workers = 8, baseUrl = None, progress = False):
+    """
+    PURPOSE
+
+    latlong() for a whole list (or column) of locations, like 50k addresses.
+    The locations are normalised (spaces and case) and deduplicated first, so each distinct one is only searched once.
+    If store is given, the results are kept in a JobStore, so the ones already searched in earlier runs are taken from there instead.
+    The rest are searched concurrently, through spiderman's fetch(), so they still go through its rate limiter.
+    Locations that OneMap can't find are remembered too; ones that fail because of an error aren't, so they get tried again next time.
+
+    PARAMETERS
+
+    locations [list, numpy array, pandas Series]: the locations to search for
+    store [str, JobStore]: where to keep the results across runs (a path or a JobStore)
+    workers [int]: how many searches can be going on at once
+    baseUrl [str]: where to search instead of oneMapUrl (like a local stand-in server)
+    progress [boolean]: whether to show a tqdm progress bar
+
+    OUTPUT
+
+    (lats, longs, report)
+    lats and longs are numpy arrays in the same order as locations, with NaN for anything not found.
+    report is a dictionary with the number of locations, unique ones, cache hits, misses, ones found and not found, and the errors for each location that failed.
+    """
+    keys = [_normaliseLocation(location) for location in locations]
+    unique = list(dict.fromkeys(keys))
+    store = JobStore.of(store, "latlong")
+
+    results = store.getMany(unique) if store is not None else {}
+    hits = len(results)
+    misses = [key for key in unique if key not in results]
+    errors = {}
+
+    def search(key):
+        try:
+            return key, _oneMap(key, baseUrl), None
+        except Exception as e:
+            return key, None, e
+
+    with ThreadPoolExecutor(max_workers = workers) as pool:
+        searched = pool.map(search, misses)
+        if progress:
+            searched = tqdm(searched, total = len(misses))
+        for key, result, error in searched:
+            if error is not None:
+                errors[key] = str(error)
+                continue
+            results[key] = result
+            if store is not None:
+                store.put(key, result)
+
+    lats = np.array([results[key]["lat"] if results.get(key) else np.nan for key in keys], dtype = float)
+    longs = np.array([results[key]["long"] if results.get(key) else np.nan for key in keys], dtype = float)
+    report = {"locations": len(keys),
+              "unique": len(unique),
+              "hits": hits,
+              "misses": len(misses),
+              "found": sum(1 for key in unique if results.get(key)),
+              "notFound": sum(1 for key in unique if key in results and not results[key]),
+              "errors": errors}
+
+    return lats, longs, report
+
+
 def regOR(keywords, toCompile = True, flags = 0):
     """
     PURPOSE
@@ -93,6 +206,120 @@ def regOR(keywords, toCompile = True, flags = 0):
         return '(' + '|'.join(keywords) + ')'
 
 
+class KeywordMatcher:
+    """
+    PURPOSE
+
+    keywordFilter() and minimumSatisfy() used to rebuild their regex (or go through every keyword) for every single string.
+    That adds up when filtering hundreds of thousands of sentences in chineseSentence() and japaneseSentence().
+    This compiles all the keywords into one regex once, so it can be reused for every string, and across calls (see keywordMatcher()).
+    It also works on whole lists, numpy arrays and pandas Series at once.
+
+    PARAMETERS
+
+    keywords [str, list]: what keywords you want to search for
+    regex [boolean]: whether the keywords are regexes, or just plain substrings
+    flags [flags]: any regex flags you want to add
+    """
+
+    def __init__(self, keywords, regex = True, flags = 0):
+        if type(keywords) == str:
+            keywords = [keywords]
+        elif type(keywords) not in [list, tuple]:
+            raise Exception("'keywords' must be a list/str")
+
+        self.keywords = list(keywords)
+        self.regex = regex
+        self.flags = flags
+        patterns = self.keywords if regex else [re.escape(keyword) for keyword in self.keywords]
+        self.pattern = re.compile('(?:' + '|'.join(patterns) + ')', flags = flags)
+        self.patterns = [re.compile(pattern, flags = flags) for pattern in patterns]
+
+
+    def search(self, string):
+        """
+        PURPOSE
+
+        Whether the string contains at least one of the keywords.
+        """
+        return self.pattern.search(string) is not None
+
+
+    def count(self, string):
+        """
+        PURPOSE
+
+        How many of the keywords the string contains (each keyword counts once).
+        """
+        if not self.search(string):
+            return 0
+        return sum(pattern.search(string) is not None for pattern in self.patterns)
+
+
+    def mask(self, strings):
+        """
+        PURPOSE
+
+        search() for every string in a list, numpy array or pandas Series.
+
+        OUTPUT
+
+        A boolean numpy array, or a boolean Series if a Series was given.
+        Anything that isn't a string (like NaN) counts as not matching.
+        """
+        if isinstance(strings, pd.Series):
+            return pd.Series(self.mask(strings.values), index = strings.index)
+        search = self.pattern.search
+        return np.fromiter((isinstance(string, str) and search(string) is not None for string in strings), dtype = bool, count = len(strings))
+
+
+    def counts(self, strings):
+        """
+        PURPOSE
+
+        count() for every string in a list, numpy array or pandas Series.
+        Only the strings which match at least one keyword get checked against each keyword separately.
+
+        OUTPUT
+
+        An int numpy array, or an int Series if a Series was given.
+        """
+        if isinstance(strings, pd.Series):
+            return pd.Series(self.counts(strings.values), index = strings.index)
+        hits = self.mask(strings)
+        total = np.zeros(len(strings), dtype = int)
+        for i in np.flatnonzero(hits):
+            total[i] = sum(pattern.search(strings[i]) is not None for pattern in self.patterns)
+        return total
+
+
+    def filter(self, strings):
+        """
+        PURPOSE
+
+        Just the strings which contain at least one of the keywords, as a list.
+        """
+        return [string for string, hit in zip(strings, self.mask(strings)) if hit]
+
+
+@lru_cache(maxsize = 256)
+def _keywordMatcher(keywords, regex, flags):
+    return KeywordMatcher(list(keywords), regex = regex, flags = flags)
+
+
+def keywordMatcher(keywords, regex = True, flags = 0):
+    """
+    PURPOSE
+
+    Gets a KeywordMatcher, reusing the one that was compiled the last time the same keywords were asked for.
+    """
+    if type(keywords) == str:
+        keywords = [keywords]
+    elif type(keywords) not in [list, tuple]:
+        raise Exception("'keywords' must be a list/str")
+    return _keywordMatcher(tuple(keywords), regex, flags)
+
+
 def minimumSatisfy(string, include=[], exclude=[], threshold=0, subtractExclude=False):
     """
     PURPOSE
@@ -104,6 +331,7 @@ def minimumSatisfy(string, include=[], exclude=[], threshold=0, subtractExclude=
     Otherwise, if subtractExclude = False, if the string does not contain the substring, then the score will also increase by +1.
     If the score exceeds the threshold, then the output is True.
     Otherwise, False.
+    If a list, numpy array or pandas Series of strings is given instead, then this is done for all of them at once, giving a boolean array (or Series).
     """
     if type(include) == str:
         include = [include]
@@ -114,12 +342,17 @@ def minimumSatisfy(string, include=[], exclude=[], threshold=0, subtractExclude=
     elif type(exclude) != list:
         raise Exception("'exclude' must be a list/str")
 
-    total = 0
-    total += sum(s in string for s in include)
-    if subtractexclude:
-        total -= sum(s in string for s in exclude)
+    if isinstance(string, str):
+        total = keywordMatcher(include, regex = False).count(string) if include else 0
+        excluded = keywordMatcher(exclude, regex = False).count(string) if exclude else 0
     else:
-        total += sum(s not in string for s in exclude)
+        total = keywordMatcher(include, regex = False).counts(string) if include else 0
+        excluded = keywordMatcher(exclude, regex = False).counts(string) if exclude else 0
+
+    if subtractExclude:
+        total = total - excluded
+    else:
+        total = total + (len(exclude) - excluded)
 
     return total >= threshold
 
@@ -158,8 +391,11 @@ def keywordFilter(listToFilter, include = [], exclude = [], flags = 0):
     elif type(exclude) != list:
         raise Exception("'exclude' must be a list/str")
     
-    if len(include) != 0: listToFilter = list(filter(lambda x: regOR(include, flags=flags).search(x), listToFilter))
-    if len(exclude) != 0: listToFilter = list(filter(lambda x: not regOR(exclude, flags=flags).search(x), listToFilter))
+    listToFilter = list(listToFilter)
+    if len(include) != 0: listToFilter = keywordMatcher(include, flags=flags).filter(listToFilter)
+    if len(exclude) != 0:
+        mask = keywordMatcher(exclude, flags=flags).mask(listToFilter)
+        listToFilter = [x for x, hit in zip(listToFilter, mask) if not hit]
 
     return listToFilter
 
@@ -219,13 +455,59 @@ def convertCoords(d,m,s):
     return float(d) + float(m)/60 + float(s)/3600
 
 
+_dmsNumber = r"(\d+(?:\.\d+)?)"
+_dmsRegex = (r"^\s*([NSEWnsew+-])?\s*" + _dmsNumber +
+             r"(?:\s*(?:°|º|d|:|\s)\s*" + _dmsNumber +
+             r"(?:\s*(?:′|'|m|:|\s)\s*" + _dmsNumber + r"(?:\s*(?:″|\"|''|′′|s))?)?)?" +
+             r"(?:\s*[°º′'])?\s*([NSEWnsew])?\s*$")
+
+
+def parseDMS(values):
+    """
+    PURPOSE
+
+    convertCoords() for a whole column of coordinates at once, straight from the strings.
+    It takes mixed formats, like "1°17′1.97″N", "103 51 5.52 E", "1:17:1.97", "S 1°17'", or just "-1.2839".
+    S and W (or a minus sign) make the coordinate negative.
+    Everything is parsed by one regex over the whole Series, then put together with numpy, instead of going row by row.
+
+    PARAMETERS
+
+    values [list, numpy array, pandas Series]: the coordinate strings
+
+    OUTPUT
+
+    Numpy array of decimal coordinates (float64), with NaN for anything that couldn't be parsed
+    """
+    strings = pd.Series(np.asarray(values, dtype = object).ravel(), dtype = object)
+    parts = strings.where(strings.map(type) == str).str.extract(_dmsRegex)
+
+    d = parts[1].astype(float).values
+    m = parts[2].astype(float).fillna(0).values
+    sec = parts[3].astype(float).fillna(0).values
+    sign = parts[4].fillna(parts[0]).str.upper().isin(["S", "W", "-"]).values
+
+    coords = d + m / 60 + sec / 3600
+    coords[(m >= 60) | (sec >= 60)] = np.nan
+    return np.where(sign, -coords, coords)
+
+
+"""
+PURPOSE
+
+The radius of the Earth (in km) used by dist() and the other distance functions.
+"""
+earthRadius = 6373.0
+
+
 def dist(x1,y1,x2,y2):
     """
     PURPOSE
 
     Calculates the distance between coordinates on the Earth.
+    For whole arrays of coordinates, use distFrom(), distMany() or distMatrix() instead.
     """
-    R = 6373.0
+    R = earthRadius
 
     lat1 = radians(x1)
     lon1 = radians(y1)
@@ -238,4 +520,230 @@ def dist(x1,y1,x2,y2):
     a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
     c = 2 * atan2(sqrt(a), sqrt(1 - a))
 
-    return R * c
\ No newline at end of file
+    return R * c
+
+
+def _radians(x, dtype):
+    return np.radians(np.asarray(x, dtype = dtype))
+
+
+def _haversine(lat1, lon1, lat2, lon2, coslat1, coslat2):
+    a = np.sin((lat2 - lat1) / 2)**2 + coslat1 * coslat2 * np.sin((lon2 - lon1) / 2)**2
+    a = np.clip(a, 0, 1)
+    return 2 * earthRadius * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+def distMany(x1,y1,x2,y2, float32 = False):
+    """
+    PURPOSE
+
+    Same as dist(), but for whole arrays (or DataFrame columns) of coordinates at once, pair by pair.
+    Either side can also just be a single point, in which case it is compared with every point on the other side (numpy broadcasting).
+
+    PARAMETERS
+
+    x1, y1 [float, list, numpy array, pandas Series]: latitudes and longitudes of the first points
+    x2, y2 [float, list, numpy array, pandas Series]: latitudes and longitudes of the second points
+    float32 [boolean]: whether to work in float32, which halves the memory used, but is only accurate to a couple of metres
+
+    OUTPUT
+
+    Numpy array of distances (in km), or a Series if any of the inputs was a Series.
+    """
+    dtype = np.float32 if float32 else np.float64
+    lat1, lon1, lat2, lon2 = (_radians(x, dtype) for x in [x1, y1, x2, y2])
+    distances = _haversine(lat1, lon1, lat2, lon2, np.cos(lat1), np.cos(lat2))
+
+    for x in [x1, y1, x2, y2]:
+        if isinstance(x, pd.Series):
+            return pd.Series(distances, index = x.index)
+    return distances
+
+
+def distFrom(x, y, xs, ys, float32 = False):
+    """
+    PURPOSE
+
+    The distance from one point to each of a lot of points.
+    Just distMany() with the single point first.
+    """
+    return distMany(x, y, xs, ys, float32 = float32)
+
+
+def distMatrix(x1,y1,x2,y2, maxBytes = 2**28, float32 = False, out = None):
+    """
+    PURPOSE
+
+    The distance between every point in the first set and every point in the second (like ~5000 bus stops and ~200 MRT exits).
+    The rows are done in chunks, so that the temporary arrays never take up more than about maxBytes at once.
+
+    PARAMETERS
+
+    x1, y1 [list, numpy array, pandas Series]: latitudes and longitudes of the first points (the rows)
+    x2, y2 [list, numpy array, pandas Series]: latitudes and longitudes of the second points (the columns)
+    maxBytes [int]: roughly how much memory the chunks are allowed to use
+    float32 [boolean]: whether to work in float32 (see distMany())
+    out [numpy array]: where to write the matrix, if it's too big to keep in memory (like a np.memmap of shape (N, M))
+
+    OUTPUT
+
+    N by M numpy array of distances (in km)
+    """
+    dtype = np.float32 if float32 else np.float64
+    lat1, lon1 = _radians(x1, dtype).ravel(), _radians(y1, dtype).ravel()
+    lat2, lon2 = _radians(x2, dtype).ravel(), _radians(y2, dtype).ravel()
+    coslat1, coslat2 = np.cos(lat1), np.cos(lat2)
+
+    if out is None:
+        out = np.empty((len(lat1), len(lat2)), dtype = dtype)
+    elif out.shape != (len(lat1), len(lat2)):
+        raise Exception("'out' must have shape (%d, %d)" % (len(lat1), len(lat2)))
+
+    # each row of a chunk needs about 4 temporary arrays the size of the second set
+    rows = max(1, int(maxBytes // (4 * max(len(lat2), 1) * np.dtype(dtype).itemsize)))
+    for start in range(0, len(lat1), rows):
+        end = min(start + rows, len(lat1))
+        out[start:end] = _haversine(lat1[start:end, None], lon1[start:end, None], lat2[None, :], lon2[None, :],
+                                    coslat1[start:end, None], coslat2[None, :])
+
+    return out
+
+
+class JobStore:
+    """
+    PURPOSE
+
+    Long scraping runs (JLPTKanji(), fullHSKProcess() etc.) used to keep everything in memory, so a crash or Ctrl-C hours in lost everything.
+    This records each unit of work (like a url or a word) as done, saving its result to a SQLite file straight away.
+    Re-running the job then skips everything that is already done.
+    Results can also be read out (with results()) while the job is still running, even from another process.
+
+    PARAMETERS
+
+    path [str]: where the SQLite file is kept
+    name [str]: the name of the job, so that several jobs can share the same file
+    """
+
+    def __init__(self, path, name = 'job'):
+        self.path = path
+        self.table = re.sub(r'\W', '_', name)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread = False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS "%s" (seq INTEGER PRIMARY KEY AUTOINCREMENT, key TEXT UNIQUE, result TEXT, finished REAL)' % self.table)
+        self.db.commit()
+
+
+    @staticmethod
+    def of(store, name):
+        """
+        PURPOSE
+
+        Lets functions take either a JobStore or just a path to one.
+        """
+        if store is None or isinstance(store, JobStore):
+            return store
+        return JobStore(store, name)
+
+
+    def __contains__(self, key):
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM "%s" WHERE key = ?' % self.table, (str(key),)).fetchone() is not None
+
+
+    def __len__(self):
+        with self.lock:
+            return self.db.execute('SELECT COUNT(*) FROM "%s"' % self.table).fetchone()[0]
+
+
+    def done(self):
+        """
+        PURPOSE
+
+        Returns the set of keys that are already done.
+        """
+        with self.lock:
+            return set(key for key, in self.db.execute('SELECT key FROM "%s"' % self.table))
+
+
+    def pending(self, keys):
+        """
+        PURPOSE
+
+        Filters a list of keys down to the ones that are not done yet, keeping their order.
+        """
+        done = self.done()
+        return [key for key in keys if str(key) not in done]
+
+
+    def put(self, key, result):
+        """
+        PURPOSE
+
+        Marks a key as done, saving its result (which has to be JSON-serialisable).
+        """
+        with self.lock:
+            self.db.execute('INSERT OR REPLACE INTO "%s" (key, result, finished) VALUES (?, ?, ?)' % self.table,
+                            (str(key), json.dumps(result, ensure_ascii = False, default = str), time.time()))
+            self.db.commit()
+
+
+    def get(self, key, default = None):
+        """
+        PURPOSE
+
+        Gets the saved result of a key, or default if it isn't done.
+        """
+        with self.lock:
+            row = self.db.execute('SELECT result FROM "%s" WHERE key = ?' % self.table, (str(key),)).fetchone()
+        return default if row is None else json.loads(row[0])
+
+
+    def getMany(self, keys):
+        """
+        PURPOSE
+
+        Gets the saved results of a list of keys.
+
+        OUTPUT
+
+        Dictionary of key to result, for the keys that are done
+        """
+        wanted = {str(key): key for key in keys}
+        results = {}
+        for key, result in self.results():
+            if key in wanted:
+                results[wanted[key]] = result
+        return results
+
+
+    def results(self, batch = 1000):
+        """
+        PURPOSE
+
+        Streams out all the saved results in the order they were finished.
+        This only reads a batch at a time, so it can be used on big jobs, and on jobs that are still running.
+
+        OUTPUT
+
+        Generator of (key, result) tuples
+        """
+        seq = 0
+        while True:
+            with self.lock:
+                rows = self.db.execute('SELECT seq, key, result FROM "%s" WHERE seq > ? ORDER BY seq LIMIT ?' % self.table, (seq, batch)).fetchall()
+            if len(rows) == 0:
+                return
+            for seq, key, result in rows:
+                yield key, json.loads(result)
+
+
+    def clear(self):
+        """
+        PURPOSE
+
+        Forgets everything, so that the job starts from scratch.
+        """
+        with self.lock:
+            self.db.execute('DELETE FROM "%s"' % self.table)
+            self.db.commit()